@@ -0,0 +1,246 @@
+import argparse
+import datetime
+import functools
+import os
+import time
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
+from db import DATABASE_PATH, create_reader_engine, database_url, get_engine, get_sessionmaker
+from models import Base, Order, OrderItem, DailySales, ArchivedMonth
+
+# Compaction moves closed months of orders and order items out of the live
+# database into one SQLite file per month, leaving the daily, hourly, payment
+# and menu item rollups behind. Order-level history stays readable through
+# history_sessionmaker(), whose connections ATTACH the archives.
+
+# Archive directory; defaults to <database name>_archive next to the database
+ARCHIVE_DIR = os.environ.get('COFFEE_SHOP_ARCHIVE_DIR')
+# Months kept in the live database, counting the current one
+HOT_MONTHS = 3
+ARCHIVED_TABLES = (Order.__table__, OrderItem.__table__)
+# SQLite's default limit on databases attached to one connection
+MAX_ATTACHED = 10
+HISTORY_ENGINES = 16
+
+def archive_dir(path=None):
+    return ARCHIVE_DIR or os.path.splitext(os.path.abspath(path or DATABASE_PATH))[0] + '_archive'
+
+def month_start(day):
+    return day.replace(day=1)
+
+def next_month(month):
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+def archive_file_name(month):
+    return f'orders_{month:%Y_%m}.db'
+
+def archived_months(session, start_date=None, end_date=None):
+    """ArchivedMonth rows for the months overlapping [start_date, end_date], oldest first"""
+    query = select(ArchivedMonth).order_by(ArchivedMonth.month)
+    if start_date:
+        query = query.where(ArchivedMonth.month >= month_start(start_date))
+    if end_date:
+        query = query.where(ArchivedMonth.month <= end_date)
+    return session.execute(query).scalars().all()
+
+def archive_end(session):
+    """First day after the last archived month, or None if nothing is archived"""
+    last = session.execute(select(func.max(ArchivedMonth.month))).scalar()
+    return next_month(last) if last else None
+
+def _last_order_time(session):
+    """order_time of the order with the highest id"""
+    return session.execute(select(Order.order_time).order_by(Order.id.desc()).limit(1)).scalar()
+
+def months_to_archive(session, hot_months=HOT_MONTHS, today=None):
+    """First days of the months compaction would move, oldest first.
+
+    Keeps the last `hot_months` months (counting the current one) and
+    everything from the month holding the highest order id on: new ids are
+    max(Order.id) + 1 over the live table, so that order must stay live or
+    its id would be handed out again. After a backfill of past dates that
+    month can be an old one.
+    """
+    cutoff = month_start(today or datetime.date.today())
+    for _ in range(hot_months - 1):
+        cutoff = month_start(cutoff - datetime.timedelta(days=1))
+    oldest = session.execute(select(func.min(Order.order_time))).scalar()
+    if oldest is None:
+        return []
+    cutoff = min(cutoff, month_start(_last_order_time(session).date()))
+    months = []
+    month = month_start(oldest.date())
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def archive_month(engine, month, directory):
+    """Move one month of orders and their items into its archive file; returns (orders, order items) moved.
+
+    Rows are copied to the archive and committed there first, then deleted
+    from the live database by id, so a crash in between leaves them in both
+    places and rerunning finishes the move. Refuses to run unless the
+    month's daily rollups account for all its orders, since they are what
+    stays behind, or if the month holds the highest order id (see
+    months_to_archive()).
+    """
+    start = datetime.datetime.combine(month, datetime.time.min)
+    end = datetime.datetime.combine(next_month(month), datetime.time.min)
+    # Close the check session before taking the write lock on the raw connection
+    with sessionmaker(bind=engine)() as session:
+        live = session.execute(
+            select(func.count(Order.id)).where(Order.order_time >= start, Order.order_time < end)
+        ).scalar()
+        if not live:
+            return 0, 0
+        if start <= _last_order_time(session) < end:
+            raise RuntimeError(f'{month:%Y-%m} holds the highest order id, which must stay live so ids '
+                               'aren\'t reused; write newer orders before archiving it')
+        archived = session.execute(select(ArchivedMonth.orders).where(ArchivedMonth.month == month)).scalar() or 0
+        rolled_up = session.execute(
+            select(func.sum(DailySales.order_count)).where(DailySales.date >= month, DailySales.date < next_month(month))
+        ).scalar() or 0
+    if live + archived != rolled_up:
+        raise RuntimeError(f'Rollups for {month:%Y-%m} count {rolled_up} orders but there are {live + archived}; '
+                           'run rollups.py before archiving')
+
+    os.makedirs(directory, exist_ok=True)
+    file_name = archive_file_name(month)
+    archive_engine = create_engine(database_url(os.path.join(directory, file_name)))
+    Base.metadata.create_all(archive_engine, tables=list(ARCHIVED_TABLES))
+    archive_engine.dispose()
+
+    orders, items = Order.__tablename__, OrderItem.__tablename__
+    order_columns = ', '.join(c.name for c in Order.__table__.columns)
+    item_columns = ', '.join(c.name for c in OrderItem.__table__.columns)
+    in_month = f'SELECT id FROM main.{orders} WHERE order_time >= ? AND order_time < ?'
+    bounds = (str(start), str(end))
+    # ATTACH can't run inside a transaction, which the engine's connections
+    # always begin, so this works on the driver connection directly
+    raw = engine.raw_connection()
+    conn = raw.driver_connection
+    try:
+        conn.execute('ATTACH DATABASE ? AS archive', (os.path.join(directory, file_name),))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'INSERT OR REPLACE INTO archive.{orders} ({order_columns}) '
+                         f'SELECT {order_columns} FROM main.{orders} WHERE id IN ({in_month})', bounds)
+            conn.execute(f'INSERT OR REPLACE INTO archive.{items} ({item_columns}) '
+                         f'SELECT {item_columns} FROM main.{items} WHERE order_id IN ({in_month})', bounds)
+            conn.execute('COMMIT')
+
+            conn.execute('BEGIN IMMEDIATE')
+            moved_items = conn.execute(f'DELETE FROM main.{items} WHERE id IN (SELECT id FROM archive.{items})').rowcount
+            moved = conn.execute(f'DELETE FROM main.{orders} WHERE id IN (SELECT id FROM archive.{orders})').rowcount
+            total_orders, total_items = conn.execute(
+                f'SELECT (SELECT count(*) FROM archive.{orders}), (SELECT count(*) FROM archive.{items})'
+            ).fetchone()
+            conn.execute(
+                f'INSERT INTO main.{ArchivedMonth.__tablename__} (month, file_name, orders, order_items, archived_at) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (month) DO UPDATE SET '
+                'orders = excluded.orders, order_items = excluded.order_items, archived_at = excluded.archived_at',
+                (month.isoformat(), file_name, total_orders, total_items, str(datetime.datetime.now()))
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    finally:
+        raw.close()
+    return moved, moved_items
+
+def compact(path=None, hot_months=HOT_MONTHS, vacuum=True, today=None, verbose=True):
+    """Archive every month older than the last `hot_months`, then VACUUM the live database.
+
+    Returns [(month, orders moved, order items moved)].
+    """
+    engine = get_engine(path)
+    with sessionmaker(bind=engine)() as session:
+        months = months_to_archive(session, hot_months, today)
+    directory = archive_dir(path)
+    archived = []
+    for month in months:
+        orders, items = archive_month(engine, month, directory)
+        if orders:
+            archived.append((month, orders, items))
+            if verbose:
+                print(f'Archived {orders} orders and {items} order items from {month:%Y-%m}')
+    if archived and vacuum:
+        # Return the freed pages to the filesystem so the live file shrinks
+        raw = engine.raw_connection()
+        try:
+            raw.driver_connection.execute('VACUUM')
+            raw.driver_connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            raw.close()
+    return archived
+
+def _attach_archives(engine, directory, file_names, include_live=True):
+    @event.listens_for(engine, 'connect')
+    def attach_archives(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for i, file_name in enumerate(file_names):
+            cursor.execute(f'ATTACH DATABASE ? AS archive_{i}',
+                           (f'file:{os.path.abspath(os.path.join(directory, file_name))}?mode=ro',))
+        # Temporary objects resolve before main ones, so these views stand in
+        # for the live tables in every unqualified query
+        for table in ARCHIVED_TABLES:
+            columns = ', '.join(c.name for c in table.columns)
+            parts = [f'SELECT {columns} FROM main.{table.name}'] if include_live else []
+            parts += [f'SELECT {columns} FROM archive_{i}.{table.name}' for i in range(len(file_names))]
+            cursor.execute(f'CREATE TEMP VIEW {table.name} AS ' + ' UNION ALL '.join(parts))
+        cursor.close()
+
+@functools.lru_cache(maxsize=HISTORY_ENGINES)
+def _history_engine(path, directory, file_names):
+    engine = create_reader_engine(path)
+    _attach_archives(engine, directory, file_names)
+    return engine
+
+def archive_engine(file_name, path=None):
+    """Read-only engine whose `orders` and `order_items` are one archive file's; dispose of it when done.
+
+    The other tables are the live database's, so joins to customers,
+    employees and menu items work. Reading archives one at a time like this
+    has no limit on how many there are.
+    """
+    engine = create_reader_engine(path, pool_size=1)
+    _attach_archives(engine, archive_dir(path), (file_name,), include_live=False)
+    return engine
+
+def history_sessionmaker(path=None, start_date=None, end_date=None):
+    """Read-only sessions that see archived orders as if they had never left.
+
+    Connections ATTACH the archives of the months overlapping
+    [start_date, end_date] (every archive if not given) and shadow `orders`
+    and `order_items` with views over the live and archived rows, so
+    queries on Order and OrderItem work unchanged; SQLite pushes filters on
+    indexed columns down into each part. Sessions list the attached files
+    in session.info['archives']. With nothing archived in range this is the
+    plain read-only sessionmaker.
+    """
+    with get_sessionmaker(path, read_only=True)() as session:
+        months = archived_months(session, start_date, end_date)
+    if not months:
+        return get_sessionmaker(path, read_only=True)
+    if len(months) > MAX_ATTACHED:
+        raise ValueError(f'{len(months)} archived months are in range but at most {MAX_ATTACHED} can be '
+                         'attached at once; narrow the date range')
+    file_names = tuple(m.file_name for m in months)
+    # session.info['archives'] tells caches which history a session can see
+    return sessionmaker(bind=_history_engine(path, archive_dir(path), file_names), info={'archives': file_names})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move closed months of orders into monthly archive databases.')
+    parser.add_argument('--hot-months', type=int, default=HOT_MONTHS,
+                        help='months kept in the live database, counting the current one')
+    parser.add_argument('--no-vacuum', action='store_true', help="don't VACUUM the live database afterwards")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    archived = compact(hot_months=args.hot_months, vacuum=not args.no_vacuum)
+    orders = sum(n for _, n, _ in archived)
+    print(f'Archived {orders} orders from {len(archived)} months to {archive_dir()} in {time.perf_counter() - started:.1f}s')
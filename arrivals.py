@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import datetime
+import random
+import time
+from simulate_transactions import TIMEZONE, BACKFILL_ORDERS_PER_HOUR, close_day, is_business_open
+from write_pipeline import BATCH_SIZE, FLUSH_MS, DURABILITY_LEVELS, WritePipeline
+
+# Relative demand by local hour, averaging 1.0 over business hours: a morning
+# rush, a lunch bump and a quiet afternoon. Hours not listed are closed.
+DEMAND_CURVE = {
+    7: 1.0, 8: 1.8, 9: 1.4, 10: 0.8, 11: 0.9, 12: 1.5,
+    13: 1.2, 14: 0.6, 15: 0.6, 16: 0.7, 17: 0.8, 18: 0.7,
+}
+
+# Arrivals waiting for the writer; streams block (back-pressure) when it's full
+QUEUE_SIZE = 10000
+REPORT_SECONDS = 10
+
+def parse_curve(text):
+    """Parse 'HOUR:WEIGHT,...' (e.g. '7:1,8:2.5,12:1.5') into a demand curve"""
+    curve = {}
+    for part in text.split(','):
+        hour, weight = part.split(':')
+        curve[int(hour)] = float(weight)
+    return curve
+
+def intensity_curve(orders_per_hour, curve=DEMAND_CURVE):
+    """Arrival rate (orders per hour) for each local hour 0-23"""
+    return [orders_per_hour * curve.get(hour, 0.0) for hour in range(24)]
+
+def next_arrival(rng, rates, after):
+    """Next arrival after `after` of a non-homogeneous Poisson process.
+
+    Uses thinning: candidate gaps are drawn at the peak rate and each
+    candidate is kept with probability rates[hour] / peak. Returns None if
+    every rate is zero.
+    """
+    peak = max(rates)
+    if peak <= 0:
+        return None
+    when = after
+    while True:
+        when += datetime.timedelta(hours=rng.expovariate(peak))
+        if rng.random() * peak < rates[when.hour]:
+            return when
+
+class SimulationClock:
+    """Local (naive) simulated time running `speed` times faster than the wall clock"""
+
+    def __init__(self, start=None, speed=1.0):
+        self.start = start or datetime.datetime.now(TIMEZONE).replace(tzinfo=None)
+        self.speed = speed
+        self._started = time.monotonic()
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=(time.monotonic() - self._started) * self.speed)
+
+    async def sleep_until(self, when):
+        delay = (when - self.now()).total_seconds() / self.speed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class ArrivalScheduler:
+    """Drive many independent order streams (stores/registers) from one event loop.
+
+    Each stream is a coroutine sleeping until its next arrival, so thousands
+    of them cost little more than their timers. Arrivals go onto a bounded
+    queue drained by a WritePipeline, which group-commits them on a worker
+    thread so blocking database calls stay off the event loop.
+    """
+
+    def __init__(self, streams=1, orders_per_hour=BACKFILL_ORDERS_PER_HOUR, curve=DEMAND_CURVE,
+                 session_factory=None, speed=1.0, start=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_ms=FLUSH_MS, durability=None, seed=None, verbose=False):
+        self.streams = streams
+        self.rates = intensity_curve(orders_per_hour, curve)
+        self.pipeline = WritePipeline(session_factory, batch_size, flush_ms, durability, seed, verbose)
+        self.session_factory = self.pipeline.session_factory
+        self.clock = SimulationClock(start, speed)
+        self.queue_size = queue_size
+        self.seed = seed
+        self.arrivals = 0
+        self.errors = 0
+        self.last_error = None
+        self.queue = None
+
+    async def _stream(self, stream_id):
+        rng = random.Random(None if self.seed is None else self.seed * 1000003 + stream_id)
+        when = self.clock.now()
+        while True:
+            when = next_arrival(rng, self.rates, when)
+            if when is None:
+                return
+            await self.clock.sleep_until(when)
+            await self.queue.put(when)
+            self.arrivals += 1
+
+    async def _closer(self):
+        # Close each business day (payroll and balance snapshot) once it has ended
+        while True:
+            now = self.clock.now()
+            if not is_business_open(now):
+                try:
+                    await asyncio.to_thread(close_day, now, self.session_factory)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+            await asyncio.sleep(60 / self.clock.speed)
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(REPORT_SECONDS)
+            pipeline = self.pipeline
+            print(f"{self.clock.now():%Y-%m-%d %H:%M:%S} - {self.arrivals} arrivals, {pipeline.orders_written} orders "
+                  f"({pipeline.orders_per_second:,.0f}/s), {self.queue.qsize()} queued, "
+                  f"{self.errors + pipeline.errors} errors; {pipeline.sql_stats.summary()}")
+            pipeline.sql_stats.reset()
+
+    async def run(self, duration=None):
+        """Run for `duration` wall-clock seconds (default: until cancelled)"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        streams = [asyncio.create_task(self._stream(i)) for i in range(self.streams)]
+        workers = [asyncio.create_task(self.pipeline.run(self.queue)),
+                   asyncio.create_task(self._closer()), asyncio.create_task(self._reporter())]
+        try:
+            if duration is None:
+                await asyncio.gather(*streams, *workers)
+            await asyncio.sleep(duration)
+            # Stop new arrivals, then let the writers finish what is already queued
+            await self._cancel(streams)
+            await self.queue.join()
+        finally:
+            await self._cancel(streams + workers)
+        return self.pipeline.orders_written
+
+    @staticmethod
+    async def _cancel(tasks):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate many concurrent order streams with hourly demand curves.')
+    parser.add_argument('--streams', type=int, default=1, help='independent store/register arrival streams')
+    parser.add_argument('--orders-per-hour', type=float, default=BACKFILL_ORDERS_PER_HOUR,
+                        help='mean arrival rate per stream while open; shaped by the demand curve')
+    parser.add_argument('--curve', type=parse_curve, default=DEMAND_CURVE,
+                        help="relative demand by local hour as 'HOUR:WEIGHT,...'")
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat,
+                        help="simulated local start time ('YYYY-MM-DD HH:MM'); defaults to now")
+    parser.add_argument('--speed', type=float, default=1.0, help='simulated seconds per wall-clock second')
+    parser.add_argument('--duration', type=float, help='wall-clock seconds to run (default: forever)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='arrivals buffered ahead of the writer')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='orders per group commit at most')
+    parser.add_argument('--flush-ms', type=float, default=FLUSH_MS, help='longest an arrival waits to be committed')
+    parser.add_argument('--durability', type=str.upper, choices=DURABILITY_LEVELS,
+                        help='PRAGMA synchronous for the writer (default: COFFEE_SHOP_DB_SYNCHRONOUS)')
+    parser.add_argument('--seed', type=int, help='random seed for reproducible arrival times')
+    args = parser.parse_args()
+    scheduler = ArrivalScheduler(
+        streams=args.streams, orders_per_hour=args.orders_per_hour, curve=args.curve, speed=args.speed, start=args.start,
+        queue_size=args.queue_size, batch_size=args.batch_size, flush_ms=args.flush_ms,
+        durability=args.durability, seed=args.seed, verbose=args.streams == 1,
+    )
+    started = time.perf_counter()
+    count = asyncio.run(scheduler.run(args.duration))
+    elapsed = time.perf_counter() - started
+    print(f'Wrote {count} orders from {args.streams} streams in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} orders/s)')
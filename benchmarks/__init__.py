@@ -0,0 +1,2 @@
+# Benchmarks for simulator throughput and dashboard query latency.
+# Run with `python -m benchmarks --help` from the repository root.
@@ -0,0 +1,66 @@
+import datetime
+import math
+import os
+import shutil
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+from db import create_writer_engine
+from init_db import upgrade_database
+from models import Order
+from seed_db import seed_database
+from simulate_transactions import OPEN_HOUR, CLOSE_HOUR, BACKFILL_ORDERS_PER_HOUR, backfill
+
+# Fixture databases are built once per scale and reused; delete the directory
+# (or pass rebuild=True) after changing the schema or the seeding logic
+FIXTURES_DIR = os.environ.get('BENCHMARK_FIXTURES_DIR', '.benchmarks')
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+FIXTURE_SEED = 1234
+FIXTURE_START = datetime.date(2025, 1, 1)
+
+def fixture_path(scale):
+    return os.path.join(FIXTURES_DIR, f'orders_{scale}.db')
+
+def fixture_plan(orders):
+    """(days, orders_per_hour) for a backfill of about `orders` orders at the usual rate"""
+    hours = CLOSE_HOUR - OPEN_HOUR
+    days = max(1, math.ceil(orders / (BACKFILL_ORDERS_PER_HOUR * hours)))
+    return days, orders / (days * hours)
+
+def build_fixture(scale, rebuild=False):
+    """Path of the fixture database for `scale`, seeding and backfilling it if needed"""
+    path = fixture_path(scale)
+    if os.path.exists(path) and not rebuild:
+        return path
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    orders = SCALES[scale]
+    days, orders_per_hour = fixture_plan(orders)
+    engine = create_writer_engine(path)
+    upgrade_database(engine)
+    seed_database(engine, customers=max(30, orders // 10), seed=FIXTURE_SEED)
+    backfill(days, start_date=FIXTURE_START, orders_per_hour=orders_per_hour, seed=FIXTURE_SEED,
+             session_factory=sessionmaker(bind=engine))
+    with sessionmaker(bind=engine)() as session:
+        count = session.query(func.count(Order.id)).scalar()
+    engine.dispose()
+    print(f'Built {path}: {count} orders over {days} days')
+    return path
+
+def fixture_last_day(scale):
+    days, _ = fixture_plan(SCALES[scale])
+    return FIXTURE_START + datetime.timedelta(days=days - 1)
+
+def scratch_copy(path, directory):
+    """Copy a fixture (checkpointed into one file) for benchmarks that write to it"""
+    target = os.path.join(directory, os.path.basename(path))
+    engine = create_writer_engine(path)
+    conn = engine.raw_connection()
+    try:
+        conn.cursor().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    engine.dispose()
+    shutil.copyfile(path, target)
+    return target
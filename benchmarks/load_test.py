@@ -0,0 +1,274 @@
+import argparse
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from benchmarks.fixtures import SCALES, build_fixture, fixture_last_day, scratch_copy
+
+# Concurrent load test: simulator writer processes and headless dashboard
+# reader processes hammer one scratch copy of a fixture database, the way the
+# simulator and a dashboard with many open tabs share coffee_shop.db.
+# Run with `python -m benchmarks.load_test --help` from the repository root.
+
+WRITERS = 2
+READERS = 8
+DURATION_SECONDS = 30
+# Workers are spawned (so each imports db.py with the run's busy timeout)
+# and start together this long after launch
+STARTUP_SECONDS = 3
+WRITER_MODES = ('transaction', 'pipeline')
+PIPELINE_BATCH_SIZE = 100
+# Transactions failing with a lock error are retried this many times, with
+# exponential backoff from RETRY_BACKOFF_MS; 0 matches the simulator, which
+# counts the error and moves on
+RETRIES = 0
+RETRY_BACKOFF_MS = 10
+PERCENTILES = (50, 99)
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+class _WorkerStats:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.failed = collections.Counter()
+        self.errors = collections.Counter()
+        self.retries = 0
+        self.lock_waits = []
+
+    def record_lock_waits(self, engine):
+        """Time every BEGIN: writers' BEGIN IMMEDIATE blocks in SQLite's busy handler until the write lock is free"""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('BEGIN'):
+                conn.info['begin_started'] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('BEGIN'):
+                self.lock_waits.append(time.perf_counter() - conn.info.pop('begin_started'))
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            if context.statement and context.statement.startswith('BEGIN') and context.connection is not None:
+                started = context.connection.info.pop('begin_started', None)
+                if started is not None:
+                    self.lock_waits.append(time.perf_counter() - started)
+
+    def run(self, name, operation, retries):
+        """Run one operation, retrying lock errors, and record its end-to-end latency"""
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                operation()
+                break
+            except Exception as e:
+                if _is_lock_error(e) and attempt < retries:
+                    self.retries += 1
+                    time.sleep(RETRY_BACKOFF_MS / 1000 * 2 ** attempt)
+                    continue
+                self.failed[name] += 1
+                self.errors[f'{type(e).__name__}: {str(e).splitlines()[0][:120]}'] += 1
+                return
+        self.latencies[name].append(time.perf_counter() - started)
+
+    def as_dict(self, role):
+        return {
+            'role': role,
+            'latencies': dict(self.latencies),
+            'failed': dict(self.failed),
+            'errors': dict(self.errors),
+            'retries': self.retries,
+            'lock_waits': self.lock_waits,
+        }
+
+def _wait_for(start_at):
+    time.sleep(max(0.0, start_at - time.time()))
+
+def writer(index, path, start_at, duration, mode, batch_size, retries, interval_ms, opening):
+    """Write orders until the run ends, one per transaction or `batch_size` per group commit"""
+    from sqlalchemy.orm import sessionmaker
+    from db import create_writer_engine
+    from reference_data import get_reference_data
+    from simulate_transactions import simulate_transaction
+    from write_pipeline import WritePipeline
+
+    engine = create_writer_engine(path)
+    Session = sessionmaker(bind=engine)
+    stats = _WorkerStats()
+    stats.record_lock_waits(engine)
+    # Warm the reference data cache before the run, waiting out other workers' locks
+    while True:
+        try:
+            with Session() as session:
+                get_reference_data(session)
+            break
+        except Exception as e:
+            if not _is_lock_error(e):
+                raise
+            time.sleep(RETRY_BACKOFF_MS / 1000)
+    stats.lock_waits.clear()
+    pipeline = WritePipeline(Session, seed=index)
+    _wait_for(start_at)
+    while time.time() < start_at + duration:
+        # Orders are stamped with the run's elapsed time after the fixture's last day
+        order_time = opening + datetime.timedelta(seconds=time.time() - start_at)
+        if mode == 'pipeline':
+            stats.run(mode, lambda: pipeline.write([order_time] * batch_size), retries)
+        else:
+            stats.run(mode, lambda: simulate_transaction(Session, order_time, verbose=False), retries)
+        if interval_ms:
+            time.sleep(interval_ms / 1000)
+    engine.dispose()
+    return stats.as_dict('writer')
+
+def reader(index, path, start_at, duration, retries, interval_ms, day, seed):
+    """Load random dashboard pages, one session per page like a Streamlit rerun, until the run ends"""
+    from sqlalchemy.orm import sessionmaker
+    from db import create_reader_engine
+    from benchmarks.run import PAGES
+
+    engine = create_reader_engine(path)
+    Session = sessionmaker(bind=engine)
+    stats = _WorkerStats()
+    stats.record_lock_waits(engine)
+    rng = random.Random(None if seed is None else seed + index)
+    pages = list(PAGES)
+
+    def load(name):
+        with Session() as session:
+            PAGES[name](session, day)
+
+    _wait_for(start_at)
+    while time.time() < start_at + duration:
+        name = rng.choice(pages)
+        stats.run(name, lambda: load(name), retries)
+        if interval_ms:
+            time.sleep(interval_ms / 1000)
+    engine.dispose()
+    return stats.as_dict('reader')
+
+def _distribution(seconds):
+    if not seconds:
+        return {}
+    values = np.asarray(seconds) * 1000
+    summary = {f'p{p}_ms': float(np.percentile(values, p)) for p in PERCENTILES}
+    summary['max_ms'] = float(values.max())
+    return summary
+
+def summarize(workers, duration):
+    """Per-operation counts, throughput and latency percentiles, plus lock waits, retries and failures per role"""
+    operations = collections.defaultdict(lambda: {'latencies': [], 'failed': 0})
+    roles = collections.defaultdict(lambda: {'workers': 0, 'lock_waits': [], 'retries': 0, 'failed': 0,
+                                              'errors': collections.Counter()})
+    for worker in workers:
+        role = roles[worker['role']]
+        role['workers'] += 1
+        role['lock_waits'] += worker['lock_waits']
+        role['retries'] += worker['retries']
+        role['failed'] += sum(worker['failed'].values())
+        role['errors'].update(worker['errors'])
+        for name, latencies in worker['latencies'].items():
+            operations[name]['latencies'] += latencies
+        for name, failed in worker['failed'].items():
+            operations[name]['failed'] += failed
+    return {
+        'operations': {
+            name: {'completed': len(op['latencies']), 'failed': op['failed'],
+                   'per_second': len(op['latencies']) / duration, **_distribution(op['latencies'])}
+            for name, op in sorted(operations.items())
+        },
+        'roles': {
+            name: {'workers': role['workers'], 'transactions': len(role['lock_waits']),
+                   'lock_wait_seconds': float(sum(role['lock_waits'])),
+                   'lock_wait': _distribution(role['lock_waits']),
+                   'retries': role['retries'], 'failed': role['failed'], 'errors': dict(role['errors'])}
+            for name, role in sorted(roles.items())
+        },
+    }
+
+def run(scale='100k', writers=WRITERS, readers=READERS, duration=DURATION_SECONDS, writer_mode='transaction',
+        batch_size=PIPELINE_BATCH_SIZE, retries=RETRIES, busy_timeout_ms=None, writer_interval_ms=0,
+        reader_interval_ms=0, seed=None, rebuild=False):
+    """Run writers and readers concurrently against a scratch copy of the `scale` fixture and summarize"""
+    if writer_mode not in WRITER_MODES:
+        raise ValueError(f'writer mode must be one of {WRITER_MODES}')
+    fixture = build_fixture(scale, rebuild)
+    day = fixture_last_day(scale)
+    opening = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(7))
+    if busy_timeout_ms is not None:
+        # Read by db.py when each spawned worker imports it
+        os.environ['COFFEE_SHOP_DB_BUSY_TIMEOUT_MS'] = str(busy_timeout_ms)
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratch_copy(fixture, directory)
+        start_at = time.time() + STARTUP_SECONDS
+        with ProcessPoolExecutor(writers + readers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [
+                pool.submit(writer, i, path, start_at, duration, writer_mode, batch_size, retries,
+                            writer_interval_ms, opening)
+                for i in range(writers)
+            ] + [
+                pool.submit(reader, i, path, start_at, duration, retries, reader_interval_ms, day, seed)
+                for i in range(readers)
+            ]
+            workers = [future.result() for future in futures]
+    summary = summarize(workers, duration)
+    summary['config'] = {
+        'scale': scale, 'writers': writers, 'readers': readers, 'duration': duration, 'writer_mode': writer_mode,
+        'batch_size': batch_size, 'retries': retries, 'busy_timeout_ms': busy_timeout_ms,
+        'writer_interval_ms': writer_interval_ms, 'reader_interval_ms': reader_interval_ms,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    return summary
+
+def print_summary(summary):
+    print(f"{'operation':<24} {'done':>8} {'failed':>7} {'per s':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, op in summary['operations'].items():
+        print(f"{name:<24} {op['completed']:>8} {op['failed']:>7} {op['per_second']:>9,.1f} "
+              f"{op.get('p50_ms', 0):>9,.1f} {op.get('p99_ms', 0):>9,.1f} {op.get('max_ms', 0):>9,.1f}")
+    for name, role in summary['roles'].items():
+        wait = role['lock_wait']
+        print(f"{name}s: {role['workers']} workers, {role['transactions']} transactions, "
+              f"lock wait {role['lock_wait_seconds']:.2f}s total (p50 {wait.get('p50_ms', 0):.1f} ms, "
+              f"p99 {wait.get('p99_ms', 0):.1f} ms), {role['retries']} retries, {role['failed']} failed")
+        for error, count in role['errors'].items():
+            print(f'  {count} x {error}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test concurrent simulator writers and dashboard readers.')
+    parser.add_argument('--scale', choices=SCALES, default='100k', help='fixture size in orders')
+    parser.add_argument('--writers', type=int, default=WRITERS, help='simulator writer processes')
+    parser.add_argument('--readers', type=int, default=READERS, help='dashboard reader processes')
+    parser.add_argument('--duration', type=float, default=DURATION_SECONDS, help='seconds of load')
+    parser.add_argument('--writer-mode', choices=WRITER_MODES, default='transaction',
+                        help='one order per transaction (simulate_transaction) or group commits (WritePipeline)')
+    parser.add_argument('--batch-size', type=int, default=PIPELINE_BATCH_SIZE, help='orders per group commit')
+    parser.add_argument('--retries', type=int, default=RETRIES, help='retries for transactions failing on a lock')
+    parser.add_argument('--busy-timeout-ms', type=int, help="SQLite busy timeout (default: db.py's)")
+    parser.add_argument('--writer-interval-ms', type=float, default=0, help='pause between writes')
+    parser.add_argument('--reader-interval-ms', type=float, default=0, help='pause between page loads')
+    parser.add_argument('--seed', type=int, help='random seed for the readers')
+    parser.add_argument('--output', help='also write the summary as JSON to this file')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the fixture database first')
+    args = parser.parse_args()
+
+    summary = run(args.scale, args.writers, args.readers, args.duration, args.writer_mode, args.batch_size,
+                  args.retries, args.busy_timeout_ms, args.writer_interval_ms, args.reader_interval_ms,
+                  args.seed, args.rebuild)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'Summary written to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy.orm import sessionmaker
+from db import create_writer_engine, create_reader_engine
+from dashboard_data import (
+    orders_page, order_receipt, HomeState, load_customers, load_employees, load_menu_items,
+    load_inventory, load_account_balance, data_version,
+)
+from customer_analytics import CustomerAnalytics
+from reference_data import get_reference_data
+from sql_profiling import profile
+from simulate_transactions import simulate_transaction, backfill
+from write_pipeline import WritePipeline
+from benchmarks.fixtures import SCALES, build_fixture, fixture_last_day, scratch_copy
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+REPEATS = 5
+# A metric regresses when it is this much worse than the baseline; page times
+# also get MIN_SECONDS of slack so sub-millisecond noise doesn't fail a run
+TOLERANCE = 0.25
+MIN_SECONDS = 0.002
+
+# Each dashboard page's data loading, given a session and the fixture's last day
+PAGES = {
+    # A viewer's first Home load; later ones fold in only new rows
+    'home': lambda session, day: HomeState().refresh(session, day, data_version(session)),
+    'customers': lambda session, day: load_customers(session),
+    # A cold load, as after a dashboard restart; later ones read only new rows
+    'customer_analytics': lambda session, day: CustomerAnalytics().refresh(session, None).report(session, day),
+    'employees': lambda session, day: load_employees(session),
+    'menu_items': lambda session, day: load_menu_items(session),
+    'inventory': lambda session, day: load_inventory(session),
+    'account_balance': lambda session, day: load_account_balance(session),
+    'transactions': lambda session, day: orders_page(session),
+    'transactions_filtered': lambda session, day: orders_page(session, start_date=day, end_date=day, payment_methods=['card']),
+    'receipt': lambda session, day: order_receipt(session, 1),
+    # What every page costs when the data hasn't changed since the last refresh
+    'unchanged': lambda session, day: data_version(session),
+}
+
+SIMULATE_TRANSACTION_ORDERS = 200
+PIPELINE_BATCHES = 10
+PIPELINE_BATCH_SIZE = 500
+BACKFILL_DAYS = 2
+
+def bench_pages(path, day, repeats=REPEATS):
+    """Median wall time, statement count and rows fetched for each page's data loading"""
+    engine = create_reader_engine(path)
+    Session = sessionmaker(bind=engine)
+    results = {}
+    for name, load in PAGES.items():
+        # Timed runs are unprofiled; one more profiled run counts statements and rows
+        timings = []
+        for _ in range(repeats):
+            with Session() as session:
+                started = time.perf_counter()
+                load(session, day)
+                timings.append(time.perf_counter() - started)
+        with Session() as session, profile() as stats:
+            load(session, day)
+        results[name] = {'seconds': statistics.median(timings), 'statements': stats.statements, 'rows': stats.rows}
+    engine.dispose()
+    return results
+
+def _orders_per_second(count, started):
+    elapsed = time.perf_counter() - started
+    return {'orders': count, 'seconds': elapsed, 'orders_per_second': count / elapsed if elapsed else 0.0}
+
+def bench_simulator(path, day):
+    """Orders per second for each write path, run against a scratch copy of the fixture"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_writer_engine(scratch_copy(path, directory))
+        Session = sessionmaker(bind=engine)
+        with Session() as session:
+            get_reference_data(session)  # warm the reference cache outside the timings
+        opening = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(12))
+        results = {}
+
+        started = time.perf_counter()
+        for i in range(SIMULATE_TRANSACTION_ORDERS):
+            simulate_transaction(Session, opening + datetime.timedelta(seconds=i), verbose=False)
+        results['simulate_transaction'] = _orders_per_second(SIMULATE_TRANSACTION_ORDERS, started)
+
+        pipeline = WritePipeline(Session, seed=0)
+        started = time.perf_counter()
+        for batch in range(PIPELINE_BATCHES):
+            pipeline.write([opening + datetime.timedelta(minutes=5 + batch, milliseconds=i) for i in range(PIPELINE_BATCH_SIZE)])
+        results['write_pipeline'] = _orders_per_second(pipeline.orders_written, started)
+
+        started = time.perf_counter()
+        count = backfill(BACKFILL_DAYS, start_date=day + datetime.timedelta(days=2), seed=0, session_factory=Session)
+        results['backfill'] = _orders_per_second(count, started)
+        engine.dispose()
+    return results
+
+def run(scales, repeats=REPEATS, rebuild=False):
+    results = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scales': {},
+    }
+    for scale in scales:
+        path = build_fixture(scale, rebuild)
+        day = fixture_last_day(scale)
+        results['scales'][scale] = {
+            'pages': bench_pages(path, day, repeats),
+            'simulator': bench_simulator(path, day),
+        }
+    return results
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Human-readable regressions of `results` against `baseline`; metrics missing from either are skipped"""
+    regressions = []
+    for scale, current in results['scales'].items():
+        base = baseline.get('scales', {}).get(scale)
+        if not base:
+            continue
+        for name, metric in current['simulator'].items():
+            expected = base['simulator'].get(name)
+            if expected and metric['orders_per_second'] < expected['orders_per_second'] * (1 - tolerance):
+                regressions.append(f"{scale} {name}: {metric['orders_per_second']:,.0f} orders/s "
+                                   f"(baseline {expected['orders_per_second']:,.0f})")
+        for name, metric in current['pages'].items():
+            expected = base['pages'].get(name)
+            if not expected:
+                continue
+            if metric['seconds'] > expected['seconds'] * (1 + tolerance) + MIN_SECONDS:
+                regressions.append(f"{scale} {name} page: {metric['seconds'] * 1000:.1f} ms "
+                                   f"(baseline {expected['seconds'] * 1000:.1f} ms)")
+            if metric['statements'] > expected['statements']:
+                regressions.append(f"{scale} {name} page: {metric['statements']} SQL statements "
+                                   f"(baseline {expected['statements']})")
+    return regressions
+
+def print_summary(results):
+    for scale, current in results['scales'].items():
+        print(f'== {scale} ==')
+        for name, metric in current['simulator'].items():
+            print(f"  {name:<28} {metric['orders_per_second']:>12,.0f} orders/s")
+        for name, metric in current['pages'].items():
+            print(f"  {name + ' page':<28} {metric['seconds'] * 1000:>9,.1f} ms  {metric['statements']:>4} statements")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark simulator throughput and dashboard query latency.')
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['1k', '100k'],
+                        help='fixture sizes in orders')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='timed runs per dashboard page')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown as a fraction')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the fixture databases first')
+    args = parser.parse_args()
+
+    results = run(args.scales, args.repeats, args.rebuild)
+    print_summary(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Regressions against the baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('No regressions against the baseline.')
+    else:
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one.')
+
+if __name__ == '__main__':
+    main()
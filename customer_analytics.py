@@ -0,0 +1,242 @@
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+from models import Customer, Order
+from archive import archive_engine, archived_months
+from loyalty import POINTS_PER_DOLLAR
+
+# Customer analytics for the dashboard: RFM segments, signup-cohort retention
+# and loyalty points. Per-customer figures live in NumPy arrays indexed by
+# customer id and are brought up to date from the orders and customers past
+# the last ones processed, so a refresh costs in proportion to new rows.
+
+RFM_BINS = 5
+# Cohorts (signup months) shown, newest first, and months since signup tracked
+COHORTS = 24
+COHORT_MONTHS = 12
+TOP_CUSTOMERS = 20
+# Rows fetched per chunk while loading, so memory stays bounded on a cold start
+CHUNK_ROWS = 100000
+# Customer/month activity keys are customer_id * MONTH_KEY + months since 1970
+MONTH_KEY = 1 << 16
+
+# First matching (recency, frequency) rule names the segment
+SEGMENT_RULES = [
+    ('Champions', lambda r, f: (r >= 4) & (f >= 4)),
+    ('Loyal', lambda r, f: (r >= 3) & (f >= 3)),
+    ('New', lambda r, f: (r >= 4) & (f <= 1)),
+    ('Promising', lambda r, f: r >= 4),
+    ('At Risk', lambda r, f: (r <= 2) & (f >= 3)),
+    ('Hibernating', lambda r, f: r <= 2),
+]
+DEFAULT_SEGMENT = 'Needs Attention'
+
+def rfm_scores(values, bins=RFM_BINS):
+    """1..bins quantile score per value, higher for larger values; ties share a score"""
+    edges = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+    return 1 + np.searchsorted(edges, values, side='left')
+
+def segments(recency_scores, frequency_scores):
+    return np.select(
+        [rule(recency_scores, frequency_scores) for _, rule in SEGMENT_RULES],
+        [name for name, _ in SEGMENT_RULES],
+        default=DEFAULT_SEGMENT,
+    )
+
+class CustomerAnalytics:
+    """RFM, cohort and loyalty figures for every customer, refreshed incrementally.
+
+    The first refresh reads every customer and makes one pass over the
+    orders, archived months included, aggregating order count, spend, last
+    order time, points earned and active months per customer; later ones
+    read only customers and live orders with ids past the last ones seen.
+    Shared between viewers, so it's thread-safe and its reports are
+    read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.last_order_id = 0
+        self.last_customer_id = 0
+        self.archives_loaded = False
+        size = 1
+        self.exists = np.zeros(size, dtype=bool)
+        self.signup_month = np.zeros(size, dtype=np.int64)
+        self.loyalty_points = np.zeros(size, dtype=np.int64)
+        self.orders = np.zeros(size, dtype=np.int64)
+        self.spend = np.zeros(size)
+        self.points_earned = np.zeros(size, dtype=np.int64)
+        # Epoch seconds of each customer's last order, 0 for none
+        self.last_order = np.zeros(size, dtype=np.int64)
+        # Sorted unique customer/month keys of the months each customer ordered in
+        self.active_months = np.zeros(0, dtype=np.int64)
+        self._report = None
+
+    def _grow(self, size):
+        if size <= len(self.exists):
+            return
+        for name in ('exists', 'signup_month', 'loyalty_points', 'orders', 'spend', 'points_earned', 'last_order'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros(size - len(array), dtype=array.dtype)]))
+
+    def _load_customers(self, session):
+        # Signup month as months since 1970, the integer form of datetime64[M]
+        signup_month = (cast(func.substr(Customer.created_at, 1, 4), Integer) * 12
+                        + cast(func.substr(Customer.created_at, 6, 2), Integer) - 1970 * 12 - 1)
+        result = session.execute(
+            select(Customer.id, signup_month, func.coalesce(Customer.loyalty_points, 0))
+            .where(Customer.id > self.last_customer_id)
+            .order_by(Customer.id)
+            .execution_options(yield_per=CHUNK_ROWS)
+        )
+        for chunk in result.partitions():
+            ids, months, points = (np.array(column, dtype=np.int64) for column in zip(*chunk))
+            self._grow(int(ids[-1]) + 1)
+            self.exists[ids] = True
+            self.signup_month[ids] = months
+            self.loyalty_points[ids] = points
+            self.last_customer_id = int(ids[-1])
+
+    def _load_orders(self, session, known_customer_id, id_range=None):
+        # One pass over the orders (those with ids in (first, last] if given)
+        # in primary key order, aggregated in NumPy: a GROUP BY over millions
+        # of customer/month groups makes SQLite sort through a temporary
+        # B-tree and takes longer than this
+        query = select(Order.customer_id, cast(func.strftime('%s', Order.order_time), Integer), Order.total_amount)
+        query = query.where(Order.customer_id.is_not(None))
+        if id_range:
+            query = query.where(Order.id > id_range[0], Order.id <= id_range[1])
+        result = session.execute(query.execution_options(yield_per=CHUNK_ROWS))
+        active_months = [self.active_months]
+        for chunk in result.partitions():
+            customer_ids, order_times, totals = zip(*chunk)
+            customer_ids = np.array(customer_ids, dtype=np.int64)
+            order_times = np.array(order_times, dtype=np.int64)
+            totals = np.array(totals, dtype=np.float64)
+            # Same rounding as loyalty.order_points()
+            points = np.trunc(totals * POINTS_PER_DOLLAR).astype(np.int64)
+            size = max(len(self.exists), int(customer_ids.max()) + 1)
+            self._grow(size)
+            self.orders += np.bincount(customer_ids, minlength=size)
+            self.spend += np.bincount(customer_ids, totals, size)
+            self.points_earned += np.bincount(customer_ids, points, size).astype(np.int64)
+            np.maximum.at(self.last_order, customer_ids, order_times)
+            # Balances read for new customers already include their orders' points
+            known = customer_ids <= known_customer_id
+            self.loyalty_points += np.bincount(customer_ids[known], points[known], size).astype(np.int64)
+            months = order_times.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+            active_months.append(np.unique(customer_ids * MONTH_KEY + months))
+        self.active_months = np.unique(np.concatenate(active_months))
+
+    def _load_archives(self, session, known_customer_id):
+        # Orders compaction moved out of the live database before this
+        # process first saw them; ones archived later were counted already
+        for month in archived_months(session):
+            engine = archive_engine(month.file_name)
+            try:
+                with Session(engine) as archive_session:
+                    self._load_orders(archive_session, known_customer_id)
+            finally:
+                engine.dispose()
+        self.archives_loaded = True
+
+    def refresh(self, session, version):
+        """Fold in new customers and orders if `version` has moved on; returns self.
+
+        Reads run in the session's transaction, so use one snapshot (a
+        read-only session) for a consistent view.
+        """
+        with self._lock:
+            if version is None or version != self.version:
+                last_order_id = session.execute(select(func.max(Order.id))).scalar() or 0
+                known_customer_id = self.last_customer_id
+                self._load_customers(session)
+                if not self.archives_loaded:
+                    self._load_archives(session, known_customer_id)
+                if last_order_id > self.last_order_id:
+                    self._load_orders(session, known_customer_id, (self.last_order_id, last_order_id))
+                    self.last_order_id = last_order_id
+                self.version = version
+                self._report = None
+        return self
+
+    def report(self, session, today):
+        """Summary tables as of `today` (cached until the next refresh that finds changes):
+
+        'totals' (dict), 'segments', 'rfm_grid', 'cohorts' (retention %) and
+        'top_customers' DataFrames.
+        """
+        with self._lock:
+            if self._report is None or self._report[0] != today:
+                self._report = (today, self._build_report(session, today))
+            return self._report[1]
+
+    def _build_report(self, session, today):
+        customer_ids = np.nonzero(self.exists)[0]
+        buyers = customer_ids[self.orders[customer_ids] > 0]
+        # Recency counts from the end of `today`, so today's orders are under a day old
+        end_of_day = (np.datetime64(today, 's') + np.timedelta64(1, 'D')).astype(np.int64)
+        customers = pd.DataFrame({
+            'customer_id': buyers,
+            'recency_days': (end_of_day - self.last_order[buyers]) / 86400,
+            'orders': self.orders[buyers],
+            'spend': self.spend[buyers],
+        })
+        if len(buyers):
+            customers['R'] = rfm_scores(-customers['recency_days'].to_numpy())
+            customers['F'] = rfm_scores(customers['orders'].to_numpy())
+            customers['M'] = rfm_scores(customers['spend'].to_numpy())
+            customers['segment'] = segments(customers['R'].to_numpy(), customers['F'].to_numpy())
+        else:
+            customers = customers.assign(R=[], F=[], M=[], segment=[])
+
+        segment_table = customers.groupby('segment').agg(
+            customers=('customer_id', 'size'),
+            avg_recency_days=('recency_days', 'mean'),
+            avg_orders=('orders', 'mean'),
+            avg_spend=('spend', 'mean'),
+            revenue=('spend', 'sum'),
+        ).sort_values('revenue', ascending=False)
+        rfm_grid = pd.crosstab(customers['R'], customers['F']).sort_index(ascending=False)
+
+        # Cohort retention: share of each signup month's customers ordering N months later
+        keys = self.active_months
+        active_ids, active_months = keys // MONTH_KEY, keys % MONTH_KEY
+        offsets = active_months - self.signup_month[active_ids]
+        tracked = self.exists[active_ids] & (offsets >= 0) & (offsets < COHORT_MONTHS)
+        cohort_sizes = pd.Series(self.signup_month[customer_ids]).value_counts()
+        active = pd.crosstab(self.signup_month[active_ids][tracked], offsets[tracked])
+        cohorts = active.reindex(index=cohort_sizes.index, columns=range(COHORT_MONTHS), fill_value=0)
+        cohorts = cohorts.div(cohort_sizes, axis=0).mul(100).sort_index(ascending=False).head(COHORTS)
+        cohorts.index = pd.Index(cohorts.index.to_numpy().astype('datetime64[M]').astype(str), name='Cohort')
+        cohorts.columns.name = 'Months since signup'
+
+        top = customers.nlargest(TOP_CUSTOMERS, 'spend')
+        names = dict(session.execute(
+            select(Customer.id, Customer.name).where(Customer.id.in_(top['customer_id'].tolist()))
+        ).all())
+        top_customers = top.assign(
+            name=[names.get(int(i)) for i in top['customer_id']],
+            last_order=self.last_order[top['customer_id']].astype('datetime64[s]'),
+            loyalty_points=self.loyalty_points[top['customer_id']],
+        )
+
+        return {
+            'totals': {
+                'customers': len(customer_ids),
+                'buyers': len(buyers),
+                'orders': int(self.orders.sum()),
+                'revenue': float(self.spend.sum()),
+                'points_outstanding': int(self.loyalty_points[customer_ids].sum()),
+                'points_earned': int(self.points_earned.sum()),
+            },
+            'segments': segment_table,
+            'rfm_grid': rfm_grid,
+            'cohorts': cohorts,
+            'top_customers': top_customers,
+        }
+
+customer_analytics = CustomerAnalytics()
@@ -1,137 +1,70 @@
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from models import Customer, Employee, MenuItem, Inventory, AccountBalance, Order, OrderItem, Base
+from models import Customer
+from db import get_engine, get_reader_engine
+from init_db import upgrade_database
+from simulate_transactions import OPEN_HOUR, CLOSE_HOUR, TIMEZONE, PAYMENT_METHODS, is_business_open, SimulationWorker
+from sql_profiling import start_profile, stop_profile
+from archive import history_sessionmaker
+from customer_analytics import customer_analytics
+from dashboard_data import (
+    ORDERS_PAGE_SIZE, orders_page, order_receipt, encode_cursor, decode_cursor, load_customers, load_employees,
+    load_menu_items, load_inventory, load_account_balance, data_version, page_cache, HomeState,
+)
 import pandas as pd
 import time
 import urllib.parse
 import os
-import random
 import datetime
-import pytz
 
 # Auto-refresh every 10 seconds
-st_autorefresh(interval=10 * 1000, key="datarefresh")
-
-# Business simulation settings
-OPEN_HOUR = 7
-CLOSE_HOUR = 19
-TIMEZONE = pytz.timezone('US/Eastern')
-PAYMENT_METHODS = ['cash', 'card', 'mobile']
-
-def is_business_open(now=None):
-    now = now or datetime.datetime.now(TIMEZONE)
-    return OPEN_HOUR <= now.hour < CLOSE_HOUR
+REFRESH_SECONDS = 10
+st_autorefresh(interval=REFRESH_SECONDS * 1000, key="datarefresh")
 
-def simulate_transaction(engine):
-    """Simulate a single transaction"""
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    try:
-        # Get random customer (or None for walk-in)
-        customers = session.query(Customer).all()
-        customer = random.choice(customers) if customers and random.random() > 0.2 else None
-        
-        # Get random employee
-        employees = session.query(Employee).all()
-        employee = random.choice(employees) if employees else None
-        
-        # Get random menu items (1-3 per order)
-        menu_items = session.query(MenuItem).filter_by(is_active=True).all()
-        if not menu_items:
-            return False
-            
-        num_items = random.randint(1, 3)
-        items = random.sample(menu_items, min(num_items, len(menu_items)))
-        
-        # Create order
-        order = Order(
-            customer_id=customer.id if customer else None,
-            employee_id=employee.id if employee else None,
-            order_time=datetime.datetime.now(TIMEZONE),
-            total_amount=0.0,
-            payment_method=random.choice(PAYMENT_METHODS)
-        )
-        session.add(order)
-        session.flush()  # Get order.id
-        
-        total = 0.0
-        for item in items:
-            quantity = random.randint(1, 2)
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_item_id=item.id,
-                quantity=quantity,
-                item_price=item.price
-            )
-            session.add(order_item)
-            total += item.price * quantity
-            
-            # Update inventory (if tracked)
-            inv = session.query(Inventory).filter(Inventory.item_name.ilike(f'%{item.name}%')).first()
-            if inv:
-                inv.quantity_on_hand = max(0, inv.quantity_on_hand - quantity)
-        
-        order.total_amount = round(total, 2)
-        
-        # Update account balance - create new entry for today if needed
-        today = datetime.date.today()
-        account = session.query(AccountBalance).filter_by(date=today).first()
-        if not account:
-            # Get the most recent balance
-            latest_account = session.query(AccountBalance).order_by(AccountBalance.date.desc()).first()
-            starting_balance = latest_account.balance if latest_account else 1000.0
-            account = AccountBalance(
-                date=today,
-                balance=starting_balance,
-                notes='Daily balance tracking'
-            )
-            session.add(account)
-            session.flush()
-        
-        account.balance += order.total_amount
-        
-        session.commit()
-        session.close()
-        return True
-    except Exception as e:
-        session.rollback()
-        session.close()
-        return False
-
-def maybe_simulate_transaction(engine):
-    """Maybe simulate a transaction if business is open"""
-    if is_business_open() and random.random() < 0.4:  # 40% chance per refresh
-        return simulate_transaction(engine)
-    return False
+# Business simulation settings (set SIMULATION_ORDERS_PER_MINUTE=0 to disable)
+SIMULATION_ORDERS_PER_MINUTE = float(os.environ.get('SIMULATION_ORDERS_PER_MINUTE', 3.0))
 
 # Database setup
 @st.cache_resource
 def init_database():
-    engine = create_engine('sqlite:///coffee_shop.db')
+    engine = get_engine()
     
-    # Create tables if they don't exist
-    Base.metadata.create_all(engine)
+    # Create tables if they don't exist and add any new columns/indexes
+    upgrade_database(engine)
     
     # Check if database is empty and seed it
     Session = sessionmaker(bind=engine)
     session = Session()
     
-    # If no customers exist, seed the database
-    if session.query(Customer).count() == 0:
-        from seed_db import seed_database
-        seed_database()
-    
+    # If no customers exist, seed the database (after closing this session,
+    # whose transaction holds the write lock)
+    is_empty = session.query(Customer).count() == 0
     session.close()
+    if is_empty:
+        from seed_db import seed_database
+        seed_database(engine)
     return engine
 
+@st.cache_resource
+def start_simulation_worker(_engine):
+    """One background simulator per server process, shared by every session"""
+    worker = SimulationWorker(sessionmaker(bind=_engine), orders_per_minute=SIMULATION_ORDERS_PER_MINUTE)
+    worker.start()
+    return worker
+
 engine = init_database()
-Session = sessionmaker(bind=engine)
+worker = start_simulation_worker(engine)
+# Page queries go through the read-only engine
+Session = sessionmaker(bind=get_reader_engine())
 session = Session()
+# Profile the SQL of this script run for the sidebar panel
+sql_stats, sql_profile_token = start_profile()
+# Page data is shared across sessions and reloaded only when this changes
+version = data_version(session)
 
-# Try to simulate a transaction (only during business hours)
-transaction_created = maybe_simulate_transaction(engine)
+# Did the simulator add an order since the last refresh?
+transaction_created = worker.last_order_at is not None and time.time() - worker.last_order_at < REFRESH_SECONDS
 
 # Sidebar navigation
 st.sidebar.title('Navigation')
@@ -147,7 +80,7 @@ else:
 
 page = st.sidebar.radio(
     'Go to',
-    ('Home', 'Customers', 'Employees', 'Menu Items', 'Inventory', 'Account Balance', 'Transactions/Orders')
+    ('Home', 'Customers', 'Customer Analytics', 'Employees', 'Menu Items', 'Inventory', 'Account Balance', 'Transactions/Orders')
 )
 
 st.title('Coffee Shop Dashboard')
@@ -165,14 +98,12 @@ if page == 'Home':
     # Gross Sales by Hour (Today)
     st.subheader('Gross Sales by Hour (Today)')
     import altair as alt
-    today = now.date()
-    orders_today = session.query(Order).filter(Order.order_time >= datetime.datetime.combine(today, datetime.time.min), Order.order_time <= datetime.datetime.combine(today, datetime.time.max)).all()
-    if orders_today:
-        # Group by hour
-        sales_by_hour = {}
-        for o in orders_today:
-            hour = o.order_time.hour
-            sales_by_hour[hour] = sales_by_hour.get(hour, 0) + o.total_amount
+    # Each viewer keeps its own incrementally updated Home data
+    if 'home_state' not in st.session_state:
+        st.session_state.home_state = HomeState()
+    home = st.session_state.home_state.refresh(session, now.date(), version)
+    if home['hourly_sales']:
+        sales_by_hour = home['hourly_sales']
         # Prepare DataFrame for chart
         hours = list(range(OPEN_HOUR, CLOSE_HOUR))
         sales = [sales_by_hour.get(h, 0) for h in hours]
@@ -188,19 +119,15 @@ if page == 'Home':
 
     st.header('Overview')
     # Basic stats
-    num_customers = session.query(Customer).count()
-    num_employees = session.query(Employee).count()
-    num_menu_items = session.query(MenuItem).count()
-    account_balance = session.query(AccountBalance).order_by(AccountBalance.date.desc()).first()
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric('Customers', num_customers)
-    col2.metric('Employees', num_employees)
-    col3.metric('Menu Items', num_menu_items)
-    col4.metric('Account Balance', f"${account_balance.balance:,.2f}" if account_balance else 'N/A')
+    col1.metric('Customers', home['customers'])
+    col2.metric('Employees', home['employees'])
+    col3.metric('Menu Items', home['menu_items'])
+    col4.metric('Account Balance', f"${home['balance']:,.2f}")
 
     # Inventory levels chart
     st.subheader('Inventory Levels')
-    inventory = session.query(Inventory).all()
+    inventory = home['inventory']
     if inventory:
         df_inventory = pd.DataFrame([
             {
@@ -215,7 +142,7 @@ if page == 'Home':
 
     # Recent customers
     st.subheader('Recent Customers')
-    recent_customers = session.query(Customer).order_by(Customer.created_at.desc()).limit(5).all()
+    recent_customers = home['recent_customers']
     if recent_customers:
         df_customers = pd.DataFrame([
             {
@@ -232,13 +159,13 @@ if page == 'Home':
 
     # Recent orders
     st.subheader('Recent Orders')
-    recent_orders = session.query(Order).order_by(Order.order_time.desc()).limit(5).all()
+    recent_orders = home['recent_orders']
     if recent_orders:
         df_orders = pd.DataFrame([
             {
                 'Order Time': o.order_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'Customer': (session.get(Customer, o.customer_id).name if o.customer_id else 'Walk-in'),
-                'Employee': (session.get(Employee, o.employee_id).name if o.employee_id else 'N/A'),
+                'Customer': o.customer_name or 'Walk-in',
+                'Employee': o.employee_name or 'N/A',
                 'Total ($)': o.total_amount,
                 'Payment': o.payment_method
             } for o in recent_orders
@@ -249,23 +176,25 @@ if page == 'Home':
 
     # Recent inventory reorder events
     st.subheader('Recent Inventory Reorders')
-    try:
-        if os.path.exists('reorder_log.txt'):
-            with open('reorder_log.txt', 'r') as f:
-                reorder_lines = f.readlines()[-10:]
-            if reorder_lines:
-                for line in reorder_lines:
-                    st.text(line.strip())
-            else:
-                st.write('No recent reorder events.')
-        else:
-            st.write('No reorder log found.')
-    except Exception as e:
-        st.write('Unable to read reorder log.')
+    recent_reorders = home['recent_reorders']
+    if recent_reorders:
+        df_reorders = pd.DataFrame([
+            {
+                'Ordered': r.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'Item': r.item_name,
+                'Quantity': f'{r.quantity:g} {r.unit}',
+                'Unit Cost': r.unit_cost,
+                'Total ($)': round(r.quantity * r.unit_cost, 2),
+                'Status': r.status
+            } for r in recent_reorders
+        ])
+        st.table(df_reorders)
+    else:
+        st.write('No recent reorder events.')
 
 elif page == 'Customers':
     st.header('Customers')
-    customers = session.query(Customer).order_by(Customer.created_at.desc()).all()
+    customers = page_cache.get(session, version, load_customers)
     if customers:
         df = pd.DataFrame([
             {
@@ -280,9 +209,51 @@ elif page == 'Customers':
     else:
         st.write('No customer data available.')
 
+elif page == 'Customer Analytics':
+    st.header('Customer Analytics')
+    # Shared by every viewer and brought up to date from new orders and customers
+    analytics = customer_analytics.refresh(session, version).report(session, now.date())
+    totals = analytics['totals']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric('Customers', f"{totals['customers']:,}")
+    col2.metric('Buyers', f"{totals['buyers']:,}")
+    col3.metric('Points Outstanding', f"{totals['points_outstanding']:,}")
+    col4.metric('Points Earned', f"{totals['points_earned']:,}")
+
+    if totals['buyers']:
+        st.subheader('RFM Segments')
+        segment_table = analytics['segments']
+        st.bar_chart(segment_table['customers'])
+        st.dataframe(segment_table.round(2).rename(columns={
+            'customers': 'Customers', 'avg_recency_days': 'Avg Days Since Order', 'avg_orders': 'Avg Orders',
+            'avg_spend': 'Avg Spend', 'revenue': 'Revenue',
+        }))
+
+        st.subheader('Recency x Frequency Scores')
+        st.caption('Customers per score pair; 5 is the most recent or most frequent fifth.')
+        st.dataframe(analytics['rfm_grid'].rename_axis(index='Recency', columns='Frequency'))
+
+        st.subheader('Cohort Retention')
+        st.caption("Percent of each signup month's customers ordering in each month since.")
+        st.dataframe(analytics['cohorts'].round(1))
+
+        st.subheader('Top Customers')
+        top = analytics['top_customers']
+        st.table(pd.DataFrame({
+            'Name': top['name'],
+            'Orders': top['orders'],
+            'Spend': top['spend'].map('${:,.2f}'.format),
+            'Last Order': top['last_order'].dt.strftime('%Y-%m-%d'),
+            'Segment': top['segment'],
+            'RFM': top['R'].astype(str) + top['F'].astype(str) + top['M'].astype(str),
+            'Loyalty Points': top['loyalty_points'],
+        }).reset_index(drop=True))
+    else:
+        st.write('No orders from customers yet.')
+
 elif page == 'Employees':
     st.header('Employees')
-    employees = session.query(Employee).order_by(Employee.name).all()
+    employees = page_cache.get(session, version, load_employees)
     if employees:
         df = pd.DataFrame([
             {
@@ -298,7 +269,7 @@ elif page == 'Employees':
 
 elif page == 'Menu Items':
     st.header('Menu Items')
-    menu_items = session.query(MenuItem).order_by(MenuItem.category, MenuItem.name).all()
+    menu_items = page_cache.get(session, version, load_menu_items)
     if menu_items:
         df = pd.DataFrame([
             {
@@ -315,7 +286,7 @@ elif page == 'Menu Items':
 
 elif page == 'Inventory':
     st.header('Inventory')
-    inventory = session.query(Inventory).order_by(Inventory.item_name).all()
+    inventory = page_cache.get(session, version, load_inventory)
     if inventory:
         df = pd.DataFrame([
             {
@@ -331,7 +302,11 @@ elif page == 'Inventory':
 
 elif page == 'Account Balance':
     st.header('Account Balance')
-    balances = session.query(AccountBalance).order_by(AccountBalance.date.desc()).all()
+    account = page_cache.get(session, version, load_account_balance)
+    st.metric('Current Balance', f"${account['balance']:,.2f}")
+
+    st.subheader('Balance Snapshots')
+    balances = account['snapshots']
     if balances:
         df = pd.DataFrame([
             {
@@ -344,43 +319,93 @@ elif page == 'Account Balance':
     else:
         st.write('No account balance data available.')
 
+    st.subheader('Recent Ledger Entries')
+    entries = account['ledger_entries']
+    if entries:
+        df = pd.DataFrame([
+            {
+                'Posted': e.posted_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'Kind': e.kind,
+                'Amount': e.amount,
+                'Reference': e.reference_id,
+                'Notes': e.notes
+            } for e in entries
+        ])
+        st.table(df)
+    else:
+        st.write('No ledger entries yet.')
+
 elif page == 'Transactions/Orders':
     st.header('Transactions / Orders')
-    orders = session.query(Order).order_by(Order.order_time.desc()).all()
-    if orders:
-        # Use query params to track selected order
-        query_params = st.query_params
-        selected_order_id = int(query_params.get('order_id', [0])[0]) if 'order_id' in query_params else None
+    # Use query params to track the selected order and page cursor
+    query_params = st.query_params
+    selected_order_id = int(query_params['order_id']) if 'order_id' in query_params else None
+    before = decode_cursor(query_params.get('before'))
+    after = decode_cursor(query_params.get('after'))
+
+    # Filters (pushed down into the SQL query)
+    col1, col2 = st.columns(2)
+    date_range = col1.date_input('Order date', value=(), max_value=now.date())
+    payment_methods = col2.multiselect('Payment method', PAYMENT_METHODS, default=PAYMENT_METHODS)
+    start_date = date_range[0] if len(date_range) > 0 else None
+    end_date = date_range[1] if len(date_range) > 1 else start_date
 
+    # Date ranges reaching back into archived months read through the attached archives
+    orders_session = session
+    if start_date:
+        try:
+            orders_session = history_sessionmaker(start_date=start_date, end_date=end_date)()
+        except ValueError as e:
+            st.warning(f'{e}. Showing orders still in the live database.')
+
+    orders, has_more = page_cache.get(
+        orders_session, version, orders_page, before, after, ORDERS_PAGE_SIZE,
+        start_date, end_date, tuple(payment_methods)
+    )
+    has_older = has_more if not after else True
+    has_newer = has_more if after else before is not None
+    if orders:
         # Build table with clickable order numbers
+        page_cursor = ''.join(f'&{k}={query_params[k]}' for k in ('before', 'after') if k in query_params)
         table_rows = []
         for o in orders:
-            order_link = f"[#{o.id}](?order_id={o.id})"
+            order_link = f"[#{o.id}](?order_id={o.id}{page_cursor})"
             table_rows.append({
                 'Order': order_link,
                 'Order Time': o.order_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'Customer': (session.get(Customer, o.customer_id).name if o.customer_id else 'Walk-in'),
-                'Employee': (session.get(Employee, o.employee_id).name if o.employee_id else 'N/A'),
+                'Customer': o.customer_name or 'Walk-in',
+                'Employee': o.employee_name or 'N/A',
                 'Total ($)': o.total_amount,
                 'Payment': o.payment_method
             })
         df = pd.DataFrame(table_rows)
         st.markdown(df.to_markdown(index=False), unsafe_allow_html=True)
 
+        # Keyset navigation
+        nav_newer, nav_older = st.columns(2)
+        if nav_newer.button('← Newer', disabled=not has_newer):
+            query_params.clear()
+            query_params['after'] = encode_cursor(orders[0].order_time, orders[0].id)
+            st.rerun()
+        if nav_older.button('Older →', disabled=not has_older):
+            query_params.clear()
+            query_params['before'] = encode_cursor(orders[-1].order_time, orders[-1].id)
+            st.rerun()
+
         # Show receipt if an order is selected
         if selected_order_id:
-            selected_order = session.get(Order, selected_order_id)
+            selected_order = page_cache.get(orders_session, version, order_receipt, selected_order_id)
             if selected_order:
                 st.subheader(f'Receipt for Order #{selected_order.id}')
                 st.markdown(f"**Order Time:** {selected_order.order_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                st.markdown(f"**Customer:** {session.get(Customer, selected_order.customer_id).name if selected_order.customer_id else 'Walk-in'}")
-                st.markdown(f"**Employee:** {session.get(Employee, selected_order.employee_id).name if selected_order.employee_id else 'N/A'}")
+                st.markdown(f"**Customer:** {selected_order.customer.name if selected_order.customer else 'Walk-in'}")
+                st.markdown(f"**Employee:** {selected_order.employee.name if selected_order.employee else 'N/A'}")
                 st.markdown(f"**Payment Method:** {selected_order.payment_method}")
                 st.markdown(f"**Total:** ${selected_order.total_amount:.2f}")
                 st.markdown('**Items:**')
                 items = [
                     {
-                        'Item': session.get(MenuItem, oi.menu_item_id).name,
+                        'Item': oi.menu_item.name,
                         'Quantity': oi.quantity,
                         'Price': oi.item_price,
                         'Subtotal': oi.quantity * oi.item_price
@@ -389,4 +414,22 @@ elif page == 'Transactions/Orders':
                 df_items = pd.DataFrame(items)
                 st.table(df_items)
     else:
-        st.write('No orders yet.') 
\ No newline at end of file
+        st.write('No orders yet.')
+    if orders_session is not session:
+        orders_session.close()
+
+session.close()
+stop_profile(sql_profile_token)
+
+# Optional SQL profile of this script run
+if st.sidebar.checkbox('Show SQL profile', key='show_sql_profile'):
+    st.sidebar.subheader('SQL Profile')
+    st.sidebar.metric('Statements', sql_stats.statements)
+    st.sidebar.metric('SQL Time', f'{sql_stats.total_seconds * 1000:.1f} ms')
+    st.sidebar.metric('Rows Fetched', sql_stats.rows)
+    if sql_stats.slowest_statement:
+        st.sidebar.caption(f'Slowest statement ({sql_stats.slowest_seconds * 1000:.1f} ms)')
+        st.sidebar.code(sql_stats.slowest_statement, language='sql')
+    for statement, count in sql_stats.n_plus_one():
+        st.sidebar.warning(f'Possible N+1 query: ran {count} times')
+        st.sidebar.code(statement, language='sql')
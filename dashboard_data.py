@@ -0,0 +1,236 @@
+import collections
+import datetime
+import threading
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import joinedload
+from models import (
+    Customer, Employee, MenuItem, Inventory, AccountBalance, LedgerEntry, Order, OrderItem, HourlySales, PurchaseOrder,
+)
+from ledger import current_balance
+from inventory import recent_reorders
+
+# Data loading for dashboard.py, kept free of Streamlit so it can be reused
+
+ORDERS_PAGE_SIZE = 50
+RECENT_ROWS = 5
+RECENT_REORDERS = 10
+LEDGER_ROWS = 50
+# Loader results kept by the shared cache, across all pages and arguments
+CACHE_ENTRIES = 256
+# New orders a Home page refresh will fold in before falling back to a full reload
+DELTA_LIMIT = 5000
+
+def encode_cursor(order_time, order_id):
+    """Keyset cursor for a row of the orders listing"""
+    return f'{order_time.isoformat()}_{order_id}'
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    order_time, order_id = cursor.rsplit('_', 1)
+    return datetime.datetime.fromisoformat(order_time), int(order_id)
+
+def _order_rows():
+    return (
+        select(Order.id, Order.order_time, Order.total_amount, Order.payment_method,
+               Customer.name.label('customer_name'), Employee.name.label('employee_name'))
+        .outerjoin(Customer, Customer.id == Order.customer_id)
+        .outerjoin(Employee, Employee.id == Order.employee_id)
+    )
+
+def orders_page(session, before=None, after=None, limit=ORDERS_PAGE_SIZE,
+                start_date=None, end_date=None, payment_methods=None):
+    """One page of orders, newest first, keyset-paginated on (order_time, id).
+
+    `before`/`after` are decoded cursors; pass `before` for the next (older)
+    page and `after` for the previous (newer) one. Returns the rows (with
+    customer and employee names joined in) and whether more rows exist past
+    the end of the page in the direction of travel.
+    """
+    key = tuple_(Order.order_time, Order.id)
+    query = _order_rows()
+    if start_date:
+        query = query.where(Order.order_time >= datetime.datetime.combine(start_date, datetime.time.min))
+    if end_date:
+        query = query.where(Order.order_time < datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+    # None means any payment method; an empty selection matches nothing
+    if payment_methods is not None:
+        query = query.where(Order.payment_method.in_(payment_methods))
+    if after:
+        query = query.where(key > tuple_(*after)).order_by(Order.order_time, Order.id)
+    else:
+        if before:
+            query = query.where(key < tuple_(*before))
+        query = query.order_by(Order.order_time.desc(), Order.id.desc())
+
+    rows = session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+    return rows, has_more
+
+def order_receipt(session, order_id):
+    """An order with its customer, employee and line items loaded in one query"""
+    return session.execute(
+        select(Order)
+        .options(
+            joinedload(Order.customer),
+            joinedload(Order.employee),
+            joinedload(Order.order_items).joinedload(OrderItem.menu_item),
+        )
+        .where(Order.id == order_id)
+    ).unique().scalar_one_or_none()
+
+class HomeState:
+    """One viewer's Home page data, kept current by fetching only what changed.
+
+    The first refresh (and the first of each day) loads from the rollups;
+    later ones fetch orders and customers with ids past the last ones seen
+    and fold them into the running hourly totals, recent-order buffer and
+    customer count, so a refresh costs in proportion to new rows rather
+    than history. Falls back to a full reload if more than DELTA_LIMIT
+    orders arrived in between. Inventory, staff and menu are small tables
+    and are simply re-read, as are the last few reorders (by primary key).
+    """
+
+    def __init__(self):
+        self.version = None
+        self.day = None
+        self.last_order_id = 0
+        self.last_customer_id = 0
+        self.customers = 0
+        self.hourly_sales = {}
+        self.recent_orders = []
+        self.data = None
+
+    def _reload(self, session, today):
+        self.day = today
+        self.hourly_sales = {r.hour: r.sales for r in session.query(HourlySales).filter_by(date=today)}
+        self.recent_orders, _ = orders_page(session, limit=RECENT_ROWS)
+        self.last_order_id = session.query(func.max(Order.id)).scalar() or 0
+        self.customers, self.last_customer_id = session.query(func.count(Customer.id), func.max(Customer.id)).one()
+        self.last_customer_id = self.last_customer_id or 0
+
+    def _apply_new_orders(self, session):
+        """Fold in orders added since the last refresh; False if there are too many"""
+        rows = session.execute(
+            _order_rows().where(Order.id > self.last_order_id).order_by(Order.id).limit(DELTA_LIMIT + 1)
+        ).all()
+        if len(rows) > DELTA_LIMIT:
+            return False
+        for row in rows:
+            # Backfills can add older orders; only today's count towards the chart
+            if row.order_time.date() == self.day:
+                self.hourly_sales[row.order_time.hour] = self.hourly_sales.get(row.order_time.hour, 0.0) + row.total_amount
+        if rows:
+            self.last_order_id = rows[-1].id
+            self.recent_orders = sorted(
+                self.recent_orders + rows, key=lambda r: (r.order_time, r.id), reverse=True
+            )[:RECENT_ROWS]
+        return True
+
+    def _apply_new_customers(self, session):
+        added, last_id = session.query(func.count(Customer.id), func.max(Customer.id)).filter(
+            Customer.id > self.last_customer_id
+        ).one()
+        if added:
+            self.customers += added
+            self.last_customer_id = last_id
+
+    def refresh(self, session, today, version):
+        """Everything the Home page shows, as a dict, updated if `version` has moved on"""
+        if version == self.version and today == self.day:
+            return self.data
+        if today != self.day or not self._apply_new_orders(session):
+            self._reload(session, today)
+        else:
+            self._apply_new_customers(session)
+        self.version = version
+        self.data = {
+            'hourly_sales': {hour: round(sales, 2) for hour, sales in self.hourly_sales.items()},
+            'customers': self.customers,
+            'employees': session.query(Employee).count(),
+            'menu_items': session.query(MenuItem).count(),
+            'balance': current_balance(session),
+            'inventory': session.query(Inventory).all(),
+            'recent_customers': session.query(Customer).order_by(Customer.created_at.desc()).limit(RECENT_ROWS).all(),
+            'recent_orders': list(self.recent_orders),
+            'recent_reorders': recent_reorders(session, RECENT_REORDERS),
+        }
+        return self.data
+
+def load_customers(session):
+    return session.query(Customer).order_by(Customer.created_at.desc()).all()
+
+def load_employees(session):
+    return session.query(Employee).order_by(Employee.name).all()
+
+def load_menu_items(session):
+    return session.query(MenuItem).order_by(MenuItem.category, MenuItem.name).all()
+
+def load_inventory(session):
+    return session.query(Inventory).order_by(Inventory.item_name).all()
+
+def load_account_balance(session):
+    return {
+        'balance': current_balance(session),
+        'snapshots': session.query(AccountBalance).order_by(AccountBalance.date.desc(), AccountBalance.id.desc()).all(),
+        'ledger_entries': session.query(LedgerEntry).order_by(LedgerEntry.id.desc()).limit(LEDGER_ROWS).all(),
+    }
+
+def data_version(session):
+    """Cheap token that changes whenever data a page shows may have changed.
+
+    Orders cover inventory depletion and receipts (both happen in order
+    transactions); ledger entries and snapshots cover the balance, and the
+    oldest live order moves when compaction archives a month. Edits to
+    existing rows (e.g. a price change) aren't seen, so clear page_cache
+    after making one.
+    """
+    return tuple(session.execute(select(select(func.min(Order.id)).scalar_subquery(), *(
+        select(func.max(column)).scalar_subquery()
+        for column in (Order.id, LedgerEntry.id, AccountBalance.id, PurchaseOrder.id,
+                       Customer.id, Employee.id, MenuItem.id, Inventory.id)
+    ))).one())
+
+class VersionedCache:
+    """Loader results shared by every session, recomputed only when the data version changes.
+
+    Concurrent requests for the same stale entry wait for one computation
+    rather than each running the queries. Cached results are shared between
+    viewers, so treat them as read-only.
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._key_locks = {}
+
+    def get(self, session, version, loader, *args):
+        # Sessions from archive.history_sessionmaker() also see archived
+        # orders, so their results are kept apart from the live database's
+        key = (loader.__name__, session.info.get('archives', ()), args)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+            result = loader(session, *args)
+            with self._lock:
+                self._entries[key] = (version, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+page_cache = VersionedCache()
@@ -0,0 +1,71 @@
+import functools
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sql_profiling import instrument
+
+# Shared database settings for every entry point; override via environment
+DATABASE_PATH = os.environ.get('COFFEE_SHOP_DB', 'coffee_shop.db')
+BUSY_TIMEOUT_MS = int(os.environ.get('COFFEE_SHOP_DB_BUSY_TIMEOUT_MS', 10000))
+SYNCHRONOUS = os.environ.get('COFFEE_SHOP_DB_SYNCHRONOUS', 'NORMAL')
+CACHE_SIZE_KB = int(os.environ.get('COFFEE_SHOP_DB_CACHE_SIZE_KB', 64 * 1024))
+WRITER_POOL_SIZE = int(os.environ.get('COFFEE_SHOP_DB_WRITER_POOL_SIZE', 5))
+READER_POOL_SIZE = int(os.environ.get('COFFEE_SHOP_DB_READER_POOL_SIZE', 20))
+
+def database_url(path=None, read_only=False):
+    path = os.path.abspath(path or DATABASE_PATH)
+    if read_only:
+        return f'sqlite:///file:{path}?mode=ro&uri=true'
+    return f'sqlite:///{path}'
+
+def _apply_pragmas(engine, read_only, synchronous):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_conn, connection_record):
+        # Let SQLAlchemy, not pysqlite, decide when transactions begin
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        # Writers take the write lock up front so a read-then-write transaction
+        # can't deadlock on lock upgrade; readers use a plain deferred snapshot
+        conn.exec_driver_sql('BEGIN' if read_only else 'BEGIN IMMEDIATE')
+
+def create_writer_engine(path=None, synchronous=SYNCHRONOUS, pool_size=WRITER_POOL_SIZE):
+    """Engine for writes: WAL journal, busy timeout and immediate transactions"""
+    engine = create_engine(
+        database_url(path),
+        connect_args={'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+        pool_size=pool_size,
+    )
+    _apply_pragmas(engine, read_only=False, synchronous=synchronous)
+    return instrument(engine)
+
+def create_reader_engine(path=None, pool_size=READER_POOL_SIZE):
+    """Read-only engine; WAL lets its connections read while a writer commits"""
+    engine = create_engine(
+        database_url(path, read_only=True),
+        connect_args={'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+        pool_size=pool_size,
+    )
+    _apply_pragmas(engine, read_only=True, synchronous=None)
+    return instrument(engine)
+
+@functools.lru_cache(maxsize=None)
+def get_engine(path=None):
+    """Process-wide writer engine for a database file"""
+    return create_writer_engine(path)
+
+@functools.lru_cache(maxsize=None)
+def get_reader_engine(path=None):
+    """Process-wide read-only engine; open the writer first so WAL mode is set"""
+    return create_reader_engine(path)
+
+def get_sessionmaker(path=None, read_only=False):
+    return sessionmaker(bind=get_reader_engine(path) if read_only else get_engine(path))
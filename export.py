@@ -0,0 +1,201 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from archive import archive_engine, archived_months
+from db import get_sessionmaker
+from models import Customer, Employee, MenuItem, Order, OrderItem
+
+# Exports stream order lines straight from the cursor in chunks of
+# CHUNK_ROWS, so memory stays flat however much history is exported.
+EXPORT_DIR = os.environ.get('COFFEE_SHOP_EXPORT_DIR', 'exports')
+CHUNK_ROWS = 10000
+FORMATS = ('csv', 'parquet')
+# Last exported order id for --since-last, per format
+STATE_FILE = '.export_state.json'
+
+def _order_lines():
+    """One row per order item with its order, menu item, customer and employee"""
+    return (
+        select(
+            Order.id.label('order_id'),
+            Order.order_time,
+            Order.payment_method,
+            Order.total_amount.label('order_total'),
+            Order.customer_id,
+            Customer.name.label('customer_name'),
+            Order.employee_id,
+            Employee.name.label('employee_name'),
+            OrderItem.id.label('order_item_id'),
+            OrderItem.menu_item_id,
+            MenuItem.name.label('menu_item_name'),
+            MenuItem.category,
+            OrderItem.quantity,
+            OrderItem.item_price,
+            (OrderItem.quantity * OrderItem.item_price).label('line_total'),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+        .outerjoin(Customer, Customer.id == Order.customer_id)
+        .outerjoin(Employee, Employee.id == Order.employee_id)
+    )
+
+def _state_path(directory):
+    return os.path.join(directory, STATE_FILE)
+
+def load_export_state(directory=EXPORT_DIR):
+    try:
+        with open(_state_path(directory)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_export_state(directory, state):
+    path = _state_path(directory)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class _ParquetWriter:
+    # One row group per chunk
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+        self.pyarrow = pyarrow
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pyarrow.Table.from_pydict({
+            column: [row[i] for row in rows] for i, column in enumerate(self.columns)
+        })
+        if self.writer is None:
+            # Take the schema from the first chunk, widening all-null columns
+            # (e.g. no registered customers yet) to nullable ones later chunks can fill
+            schema = self.pyarrow.schema([
+                field.with_type(self.pyarrow.string()) if self.pyarrow.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def _read_chunks(query, chunk_rows, session_factory, start_date, end_date):
+    """Result chunks from each archived month in range, oldest first, then from the live database"""
+    file_names = []
+    if session_factory is None:
+        session_factory = get_sessionmaker(read_only=True)
+        with session_factory() as session:
+            file_names = [m.file_name for m in archived_months(session, start_date, end_date)]
+    # One archive at a time, however many months are archived
+    for file_name in file_names:
+        engine = archive_engine(file_name)
+        try:
+            with Session(engine) as session:
+                yield from session.execute(query.execution_options(stream_results=True, yield_per=chunk_rows)).partitions()
+        finally:
+            engine.dispose()
+    with session_factory() as session:
+        yield from session.execute(query.execution_options(stream_results=True, yield_per=chunk_rows)).partitions()
+
+def export_orders(output=None, fmt='csv', start_date=None, end_date=None, since_last=False,
+                  chunk_rows=CHUNK_ROWS, session_factory=None, directory=EXPORT_DIR):
+    """Stream order lines to a CSV or Parquet file and return (path, rows written).
+
+    `start_date`/`end_date` bound the order date (inclusive). With
+    `since_last`, only orders after the last one a previous since-last
+    export of this format wrote are included, and the high-water mark is
+    advanced once the file is complete. Reads use the read-only engine:
+    the archives of the months in range one by one, oldest first, then the
+    live database.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {FORMATS}')
+    os.makedirs(directory, exist_ok=True)
+    state = load_export_state(directory)
+    last_order_id = state.get(fmt, {}).get('last_order_id', 0) if since_last else 0
+
+    # Each order follows an index so SQLite streams rows instead of sorting
+    # the whole result first: a date range walks ix_orders_order_time, and
+    # everything else walks order_items by ix_order_items_order_id
+    query = _order_lines()
+    if start_date or end_date:
+        if start_date:
+            query = query.where(Order.order_time >= datetime.datetime.combine(start_date, datetime.time.min))
+        if end_date:
+            query = query.where(Order.order_time < datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+        if last_order_id:
+            query = query.where(Order.id > last_order_id)
+        query = query.order_by(Order.order_time, Order.id, OrderItem.id)
+    else:
+        if last_order_id:
+            query = query.where(OrderItem.order_id > last_order_id)
+        query = query.order_by(OrderItem.order_id, OrderItem.id)
+
+    if output is None:
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(directory, f'orders_{stamp}.{fmt}')
+    columns = [c.name for c in query.selected_columns]
+    writer_class = _ParquetWriter if fmt == 'parquet' else _CsvWriter
+    # Write to a temporary name so a failed export never looks complete
+    writer = writer_class(output + '.partial', columns)
+    written = 0
+    max_order_id = last_order_id
+    try:
+        for chunk in _read_chunks(query, chunk_rows, session_factory, start_date, end_date):
+            writer.write(chunk)
+            written += len(chunk)
+            max_order_id = max(max_order_id, max(row.order_id for row in chunk))
+        writer.close()
+    except Exception:
+        writer.close()
+        os.remove(output + '.partial')
+        raise
+    os.replace(output + '.partial', output)
+
+    if since_last:
+        state[fmt] = {
+            'last_order_id': max_order_id,
+            'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'file': output,
+        }
+        _save_export_state(directory, state)
+    return output, written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export order history (one row per order item).')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format')
+    parser.add_argument('--output', help='output file (default: a timestamped file in the export directory)')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat, help='first order date (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, help='last order date (YYYY-MM-DD)')
+    parser.add_argument('--since-last', action='store_true',
+                        help='only orders newer than the previous --since-last export of this format')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows fetched and written per chunk')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    path, rows = export_orders(args.output, args.format, args.start_date, args.end_date,
+                               args.since_last, args.chunk_rows)
+    print(f'Exported {rows} order lines to {path} in {time.perf_counter() - started:.1f}s')
@@ -1,7 +1,67 @@
-from sqlalchemy import create_engine
-from models import Base
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.orm import sessionmaker
+from models import Base, MenuItem, RecipeItem, Inventory, Order, DailySales, AccountBalance, LedgerEntry
+from seed_db import seed_recipes
+from db import get_engine
+from rollups import rebuild_rollups
+from ledger import post, shop_now, take_balance_snapshot
 
-engine = create_engine('sqlite:///coffee_shop.db')
-Base.metadata.create_all(engine)
+def _add_missing_columns(conn):
+    """ALTER TABLE ADD COLUMN for model columns an older database lacks; returns what was added"""
+    inspector = inspect(conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}'
+            if column.default is not None and column.default.is_scalar:
+                ddl += f' DEFAULT {column.default.arg!r}'
+            conn.execute(text(ddl))
+            added.add((table.name, column.name))
+            print(f'Added column {table.name}.{column.name}')
+    return added
 
-print('Database initialized!') 
\ No newline at end of file
+def upgrade_database(engine):
+    """Bring an existing database up to the current models; safe to run repeatedly"""
+    # New tables
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # New columns on existing tables
+        added_columns = _add_missing_columns(conn)
+        # Indexes declared after the table was first created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    # Databases created before recipes existed get the default recipe mapping
+    session = sessionmaker(bind=engine)()
+    if session.query(RecipeItem).count() == 0 and session.query(MenuItem).count() > 0:
+        seed_recipes(session)
+    # Reorder policy columns: keep the old pricing of items sold one-for-one at menu cost
+    if ('inventory', 'unit_cost') in added_columns:
+        one_for_one = (
+            select(MenuItem.cost)
+            .join(RecipeItem, RecipeItem.menu_item_id == MenuItem.id)
+            .where(RecipeItem.inventory_id == Inventory.id, RecipeItem.quantity == 1)
+            .limit(1)
+            .scalar_subquery()
+        )
+        session.execute(update(Inventory).where(one_for_one.is_not(None)).values(unit_cost=one_for_one))
+        session.commit()
+    # Databases created before the sales rollups existed get them computed once
+    if session.query(DailySales.id).first() is None and session.query(Order.id).first() is not None:
+        rebuild_rollups(session)
+    # Databases created before the cash ledger existed open it at their latest balance
+    if session.query(LedgerEntry.id).first() is None:
+        latest = session.query(AccountBalance).order_by(AccountBalance.date.desc(), AccountBalance.id.desc()).first()
+        if latest:
+            opened_at = shop_now()
+            post(session, latest.balance, 'opening', posted_at=opened_at, notes='Carried over from account_balance')
+            take_balance_snapshot(session, as_of=opened_at, notes='Ledger opening balance')
+            session.commit()
+    session.close()
+
+if __name__ == '__main__':
+    upgrade_database(get_engine())
+    print('Database initialized!')
@@ -0,0 +1,138 @@
+import datetime
+from sqlalchemy import and_, case, exists, func, select, update
+from models import Inventory, PurchaseOrder, PurchaseOrderLine
+from ledger import post, shop_now
+
+
+def deplete_inventory(session, usage):
+    """Subtract {inventory_id: amount} from stock in a single UPDATE.
+
+    Items with a lead time floor at zero. Zero-lead-time items are topped
+    up as soon as they run low, so they never run out order by order; when
+    a batch (e.g. a backfilled day) uses more than is on hand they go below
+    zero instead, and place_reorders() then buys back everything used.
+    Returns the ids of the touched rows that are now at or below their
+    reorder level, ready to hand to place_reorders().
+    """
+    usage = {inv_id: amount for inv_id, amount in usage.items() if amount}
+    if not usage:
+        return []
+    remaining = Inventory.quantity_on_hand - case(usage, value=Inventory.id, else_=0)
+    session.execute(
+        update(Inventory)
+        .where(Inventory.id.in_(usage))
+        .values(quantity_on_hand=case(
+            (Inventory.lead_time_days > 0, func.max(0, remaining)),
+            else_=remaining,
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    # Read back rather than UPDATE ... RETURNING, which needs SQLite 3.35+;
+    # the writer's immediate transaction already holds the write lock
+    return session.execute(
+        select(Inventory.id)
+        .where(Inventory.id.in_(usage), Inventory.quantity_on_hand <= Inventory.reorder_level)
+    ).scalars().all()
+
+
+def place_reorders(session, inventory_ids, now=None, verbose=True):
+    """Raise purchase orders for the given items that are low and not already on order.
+
+    Quantities, costs and lead times come from each item's reorder policy.
+    Zero-lead-time items go on a purchase order of their own, received
+    straight away, so they never wait on slower items; the rest share one
+    that arrives after the longest of their lead times. The cost is charged
+    immediately. Runs in the caller's transaction and returns the
+    PurchaseOrders raised.
+    """
+    if not inventory_ids:
+        return []
+    now = now or shop_now()
+    on_order = exists().where(and_(
+        PurchaseOrderLine.inventory_id == Inventory.id,
+        PurchaseOrderLine.purchase_order_id == PurchaseOrder.id,
+        PurchaseOrder.status == 'open',
+    ))
+    low = session.execute(
+        select(Inventory)
+        .where(Inventory.id.in_(inventory_ids),
+               Inventory.quantity_on_hand <= Inventory.reorder_level,
+               ~on_order)
+        .execution_options(populate_existing=True)
+    ).scalars().all()
+    low = [inv for inv in low if inv.restock_level > inv.quantity_on_hand]
+    purchase_orders = []
+    for items in ([inv for inv in low if inv.lead_time_days <= 0], [inv for inv in low if inv.lead_time_days > 0]):
+        if items:
+            purchase_orders.append(_raise_purchase_order(session, items, now, verbose))
+    return purchase_orders
+
+
+def _raise_purchase_order(session, items, now, verbose):
+    lines = [
+        PurchaseOrderLine(inventory_id=inv.id, quantity=inv.restock_level - inv.quantity_on_hand, unit_cost=inv.unit_cost)
+        for inv in items
+    ]
+    lead_time = max(inv.lead_time_days for inv in items)
+    purchase_order = PurchaseOrder(
+        created_at=now,
+        expected_at=now + datetime.timedelta(days=lead_time),
+        status='open',
+        total_cost=round(sum(line.quantity * line.unit_cost for line in lines), 2),
+        lines=lines,
+    )
+    session.add(purchase_order)
+    session.flush()
+    post(session, -purchase_order.total_cost, 'reorder', posted_at=now, reference_id=purchase_order.id)
+
+    # The purchase order lines are the reorder event log; see recent_reorders()
+    if verbose:
+        names = {inv.id: inv.item_name for inv in items}
+        for line in lines:
+            print(f"Reordered {line.quantity:g} {names[line.inventory_id]} at ${line.unit_cost:.2f}/unit. "
+                  f"Total cost: ${line.quantity * line.unit_cost:.2f}")
+
+    if lead_time <= 0:
+        receive_purchase_orders(session, now)
+    return purchase_order
+
+
+def recent_reorders(session, limit=10):
+    """The last `limit` reorder events (purchase order lines), newest first.
+
+    Walks the line primary key backwards, so the cost doesn't grow with
+    the number of reorders ever placed.
+    """
+    return session.execute(
+        select(PurchaseOrder.created_at, Inventory.item_name, Inventory.unit, PurchaseOrderLine.quantity,
+               PurchaseOrderLine.unit_cost, PurchaseOrder.status, PurchaseOrder.expected_at)
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.purchase_order_id)
+        .join(Inventory, Inventory.id == PurchaseOrderLine.inventory_id)
+        .order_by(PurchaseOrderLine.id.desc())
+        .limit(limit)
+    ).all()
+
+
+def receive_purchase_orders(session, now=None):
+    """Add the stock of every open purchase order that has arrived by `now`"""
+    now = now or shop_now()
+    due = select(PurchaseOrder.id).where(PurchaseOrder.status == 'open', PurchaseOrder.expected_at <= now)
+    arrived = dict(session.execute(
+        select(PurchaseOrderLine.inventory_id, func.sum(PurchaseOrderLine.quantity))
+        .where(PurchaseOrderLine.purchase_order_id.in_(due))
+        .group_by(PurchaseOrderLine.inventory_id)
+    ).all())
+    if not arrived:
+        return
+    session.execute(
+        update(Inventory)
+        .where(Inventory.id.in_(arrived))
+        .values(quantity_on_hand=Inventory.quantity_on_hand + case(arrived, value=Inventory.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    session.execute(
+        update(PurchaseOrder)
+        .where(PurchaseOrder.status == 'open', PurchaseOrder.expected_at <= now)
+        .values(status='received', received_at=now)
+        .execution_options(synchronize_session=False)
+    )
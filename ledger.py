@@ -0,0 +1,101 @@
+import datetime
+from sqlalchemy import func, insert, select
+from models import AccountBalance, LedgerEntry, Employee, StaffSchedule
+
+# Cash is an append-only ledger; AccountBalance rows are periodic snapshots of
+# its running total, so writers only ever insert and never contend on one row.
+# A snapshot's balance covers entries posted at or before `as_of`, and
+# `ledger_entry_id` is the highest id that existed when it was taken, which
+# lets entries written later but backdated (e.g. by a backfill) be found.
+
+CLOSE_OF_BUSINESS = 'Close of business'
+
+def shop_now():
+    """The current time as a naive wall-clock time in the shop's timezone, the way orders and closes are stamped"""
+    from simulate_transactions import TIMEZONE
+    return datetime.datetime.now(TIMEZONE).replace(tzinfo=None)
+
+def post(session, amount, kind, posted_at=None, reference_id=None, notes=None):
+    """Append one ledger entry in the caller's transaction"""
+    post_many(session, [{
+        'posted_at': posted_at or shop_now(),
+        'amount': round(amount, 2),
+        'kind': kind,
+        'reference_id': reference_id,
+        'notes': notes,
+    }])
+
+def post_many(session, entries):
+    """Append ledger entries given as dicts of LedgerEntry columns"""
+    if entries:
+        session.execute(insert(LedgerEntry), entries)
+
+def latest_snapshot(session, as_of=None):
+    query = select(AccountBalance).where(AccountBalance.as_of.is_not(None))
+    if as_of is not None:
+        query = query.where(AccountBalance.as_of <= as_of)
+    return session.execute(
+        query.order_by(AccountBalance.as_of.desc(), AccountBalance.id.desc()).limit(1)
+    ).scalar()
+
+def balance_at(session, when=None):
+    """Cash balance as of `when` (default: everything posted so far).
+
+    Starts from the latest snapshot at or before `when` and adds the ledger
+    tail: entries posted after the snapshot time, plus any entries written
+    after the snapshot but dated before it.
+    """
+    snapshot = latest_snapshot(session, when)
+    amount = func.coalesce(func.sum(LedgerEntry.amount), 0.0)
+    tail = select(amount)
+    if when is not None:
+        tail = tail.where(LedgerEntry.posted_at <= when)
+    if snapshot is None:
+        return round(session.execute(tail).scalar(), 2)
+    after = session.execute(tail.where(LedgerEntry.posted_at > snapshot.as_of)).scalar()
+    late = session.execute(
+        select(amount).where(LedgerEntry.id > (snapshot.ledger_entry_id or 0), LedgerEntry.posted_at <= snapshot.as_of)
+    ).scalar()
+    return round(snapshot.balance + after + late, 2)
+
+def current_balance(session):
+    return balance_at(session)
+
+def take_balance_snapshot(session, as_of=None, notes=None):
+    """Record the balance as of `as_of` (default now) as a new AccountBalance row"""
+    as_of = as_of or shop_now()
+    last_entry_id = session.execute(select(func.max(LedgerEntry.id))).scalar() or 0
+    snapshot = AccountBalance(
+        date=as_of.date(),
+        balance=balance_at(session, as_of),
+        notes=notes,
+        as_of=as_of,
+        ledger_entry_id=last_entry_id,
+    )
+    session.add(snapshot)
+    session.flush()
+    return snapshot
+
+def close_business_day(session, day, closed_at):
+    """Post the day's payroll from the staff schedule and snapshot the balance.
+
+    Does nothing if the day has already been closed. Runs in the caller's
+    transaction.
+    """
+    already_closed = session.execute(
+        select(AccountBalance.id).where(AccountBalance.date == day, AccountBalance.notes == CLOSE_OF_BUSINESS)
+    ).first()
+    if already_closed:
+        return None
+    shifts = session.execute(
+        select(Employee.hourly_wage, StaffSchedule.shift_start, StaffSchedule.shift_end)
+        .join(Employee, Employee.id == StaffSchedule.employee_id)
+        .where(StaffSchedule.shift_date == day)
+    ).all()
+    payroll = sum(
+        wage * (datetime.datetime.combine(day, end) - datetime.datetime.combine(day, start)).total_seconds() / 3600
+        for wage, start, end in shifts
+    )
+    if payroll:
+        post(session, -payroll, 'payroll', posted_at=closed_at, notes=f'{len(shifts)} shifts on {day}')
+    return take_balance_snapshot(session, as_of=closed_at, notes=CLOSE_OF_BUSINESS)
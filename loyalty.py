@@ -0,0 +1,30 @@
+import collections
+from sqlalchemy import bindparam, update
+from models import Customer
+
+# Registered customers earn loyalty points on every order, at this many
+# points per whole dollar spent
+POINTS_PER_DOLLAR = 1
+
+def order_points(total):
+    return int(total * POINTS_PER_DOLLAR)
+
+def accrue_points(session, orders):
+    """Add the points earned by (customer_id, order total) pairs to the customers' balances.
+
+    Walk-ins (customer_id None) earn nothing. One executemany UPDATE per
+    call, in the caller's transaction.
+    """
+    earned = collections.Counter()
+    for customer_id, total in orders:
+        if customer_id is not None:
+            earned[customer_id] += order_points(total)
+    if not earned:
+        return
+    customers = Customer.__table__
+    session.execute(
+        update(customers)
+        .where(customers.c.id == bindparam('customer_id'))
+        .values(loyalty_points=customers.c.loyalty_points + bindparam('points')),
+        [{'customer_id': customer_id, 'points': points} for customer_id, points in earned.items()]
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date, Time
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date, Time, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship
 import datetime
 
@@ -11,7 +11,7 @@ class Customer(Base):
     email = Column(String, unique=True)
     phone = Column(String, unique=True)
     loyalty_points = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     orders = relationship('Order', back_populates='customer')
 
 class Employee(Base):
@@ -26,6 +26,7 @@ class Employee(Base):
 
 class StaffSchedule(Base):
     __tablename__ = 'staff_schedules'
+    __table_args__ = (Index('ix_staff_schedules_employee_id_shift_date', 'employee_id', 'shift_date'),)
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('employees.id'))
     shift_date = Column(Date, nullable=False)
@@ -42,13 +43,14 @@ class MenuItem(Base):
     cost = Column(Float, nullable=False)
     is_active = Column(Boolean, default=True)
     order_items = relationship('OrderItem', back_populates='menu_item')
+    recipe_items = relationship('RecipeItem', back_populates='menu_item')
 
 class Order(Base):
     __tablename__ = 'orders'
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey('customers.id'), nullable=True)
-    employee_id = Column(Integer, ForeignKey('employees.id'))
-    order_time = Column(DateTime, default=datetime.datetime.utcnow)
+    customer_id = Column(Integer, ForeignKey('customers.id'), nullable=True, index=True)
+    employee_id = Column(Integer, ForeignKey('employees.id'), index=True)
+    order_time = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     total_amount = Column(Float, nullable=False)
     payment_method = Column(String, nullable=False)
     customer = relationship('Customer', back_populates='orders')
@@ -58,8 +60,8 @@ class Order(Base):
 class OrderItem(Base):
     __tablename__ = 'order_items'
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('orders.id'))
-    menu_item_id = Column(Integer, ForeignKey('menu_items.id'))
+    order_id = Column(Integer, ForeignKey('orders.id'), index=True)
+    menu_item_id = Column(Integer, ForeignKey('menu_items.id'), index=True)
     quantity = Column(Integer, nullable=False)
     item_price = Column(Float, nullable=False)
     order = relationship('Order', back_populates='order_items')
@@ -72,10 +74,109 @@ class Inventory(Base):
     quantity_on_hand = Column(Float, nullable=False)
     reorder_level = Column(Float, nullable=False)
     unit = Column(String, nullable=False)
+    # Reorder policy: top back up to restock_level at unit_cost, arriving after lead_time_days
+    restock_level = Column(Float, nullable=False, default=20.0)
+    unit_cost = Column(Float, nullable=False, default=2.0)
+    lead_time_days = Column(Float, nullable=False, default=0.0)
+    recipe_items = relationship('RecipeItem', back_populates='inventory_item')
+
+# Bill of materials: inventory used per unit of a menu item sold
+class RecipeItem(Base):
+    __tablename__ = 'recipe_items'
+    __table_args__ = (UniqueConstraint('menu_item_id', 'inventory_id'),)
+    id = Column(Integer, primary_key=True)
+    menu_item_id = Column(Integer, ForeignKey('menu_items.id'), nullable=False)
+    inventory_id = Column(Integer, ForeignKey('inventory.id'), nullable=False, index=True)
+    quantity = Column(Float, nullable=False)
+    menu_item = relationship('MenuItem', back_populates='recipe_items')
+    inventory_item = relationship('Inventory', back_populates='recipe_items')
+
+class PurchaseOrder(Base):
+    __tablename__ = 'purchase_orders'
+    __table_args__ = (Index('ix_purchase_orders_status_expected_at', 'status', 'expected_at'),)
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    expected_at = Column(DateTime, nullable=False)
+    received_at = Column(DateTime)
+    status = Column(String, nullable=False, default='open')
+    total_cost = Column(Float, nullable=False)
+    lines = relationship('PurchaseOrderLine', back_populates='purchase_order')
 
+class PurchaseOrderLine(Base):
+    __tablename__ = 'purchase_order_lines'
+    id = Column(Integer, primary_key=True)
+    purchase_order_id = Column(Integer, ForeignKey('purchase_orders.id'), nullable=False, index=True)
+    inventory_id = Column(Integer, ForeignKey('inventory.id'), nullable=False, index=True)
+    quantity = Column(Float, nullable=False)
+    unit_cost = Column(Float, nullable=False)
+    purchase_order = relationship('PurchaseOrder', back_populates='lines')
+    inventory_item = relationship('Inventory')
+
+# Balance snapshots: `balance` is the ledger total as of `as_of`, covering
+# entries up to `ledger_entry_id` (see ledger.py)
 class AccountBalance(Base):
     __tablename__ = 'account_balance'
     id = Column(Integer, primary_key=True)
-    date = Column(Date, default=datetime.date.today)
+    date = Column(Date, default=datetime.date.today, index=True)
     balance = Column(Float, nullable=False)
-    notes = Column(String) 
\ No newline at end of file
+    notes = Column(String)
+    as_of = Column(DateTime, index=True)
+    ledger_entry_id = Column(Integer)
+
+# Append-only cash ledger: order revenue, reorder costs, payroll
+class LedgerEntry(Base):
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (Index('ix_ledger_entries_posted_at_amount', 'posted_at', 'amount'),)
+    id = Column(Integer, primary_key=True)
+    posted_at = Column(DateTime, nullable=False)
+    amount = Column(Float, nullable=False)
+    kind = Column(String, nullable=False)
+    reference_id = Column(Integer)
+    notes = Column(String)
+
+# Sales rollups, maintained by rollups.record_orders() as orders are written
+class HourlySales(Base):
+    __tablename__ = 'hourly_sales'
+    __table_args__ = (UniqueConstraint('date', 'hour'),)
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    hour = Column(Integer, nullable=False)
+    sales = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+
+class DailySales(Base):
+    __tablename__ = 'daily_sales'
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False, unique=True)
+    sales = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+
+class PaymentMethodSales(Base):
+    __tablename__ = 'payment_method_sales'
+    __table_args__ = (UniqueConstraint('date', 'payment_method'),)
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    payment_method = Column(String, nullable=False)
+    sales = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+class MenuItemSales(Base):
+    __tablename__ = 'menu_item_sales'
+    __table_args__ = (UniqueConstraint('date', 'menu_item_id'),)
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    menu_item_id = Column(Integer, ForeignKey('menu_items.id'), nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+class ArchivedMonth(Base):
+    __tablename__ = 'archived_months'
+    id = Column(Integer, primary_key=True)
+    # First day of the month whose orders and order items were moved out
+    month = Column(Date, nullable=False, unique=True)
+    file_name = Column(String, nullable=False)
+    orders = Column(Integer, nullable=False)
+    order_items = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
@@ -0,0 +1,117 @@
+import argparse
+import dataclasses
+import datetime
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pytz
+from sqlalchemy import func, update
+from sqlalchemy.orm import sessionmaker
+from db import get_engine
+from init_db import upgrade_database
+from models import Customer, MenuItem
+from seed_db import seed_database
+from simulate_transactions import backfill
+
+# Each store simulates into its own database file under STORES_DIR, so store
+# processes never contend for the same SQLite write lock.
+STORES_DIR = os.environ.get('COFFEE_SHOP_STORES_DIR', 'stores')
+TIMEZONES = ['US/Eastern', 'US/Central', 'US/Mountain', 'US/Pacific']
+
+@dataclasses.dataclass
+class StoreConfig:
+    store_id: int
+    open_hour: int = 7
+    close_hour: int = 19
+    timezone: str = 'US/Eastern'
+    staff: int = 7
+    price_multiplier: float = 1.0
+    orders_per_hour: float = 180
+    seed: int = 0
+
+    @property
+    def db_path(self):
+        return os.path.join(STORES_DIR, f'store_{self.store_id:04d}.db')
+
+def default_stores(count, seed=0):
+    """A chain of `count` stores with varied, reproducible parameters"""
+    rng = random.Random(seed)
+    return [
+        StoreConfig(
+            store_id=store_id,
+            open_hour=rng.choice([6, 7, 8]),
+            close_hour=rng.choice([18, 19, 20, 21]),
+            timezone=rng.choice(TIMEZONES),
+            staff=rng.randint(5, 12),
+            price_multiplier=round(rng.uniform(0.9, 1.2), 2),
+            orders_per_hour=rng.randint(120, 240),
+            seed=seed * 100003 + store_id,
+        )
+        for store_id in range(1, count + 1)
+    ]
+
+def prepare_store(config):
+    """Create and seed a store's database if needed; returns its engine"""
+    engine = get_engine(config.db_path)
+    upgrade_database(engine)
+    Session = sessionmaker(bind=engine)
+    # Writer transactions hold the write lock, so close before seeding opens its own
+    with Session() as session:
+        is_empty = session.query(Customer.id).first() is None
+    if is_empty:
+        seed_database(engine, employees=config.staff, seed=config.seed)
+        with Session() as session:
+            session.execute(update(MenuItem).values(price=func.round(MenuItem.price * config.price_multiplier, 2)))
+            session.commit()
+    return engine
+
+def run_store(config, days, start_date=None):
+    """Seed (if needed) and backfill one store; runs inside a worker process"""
+    started = time.perf_counter()
+    engine = prepare_store(config)
+    orders = backfill(
+        days,
+        start_date=start_date,
+        orders_per_hour=config.orders_per_hour,
+        seed=config.seed,
+        session_factory=sessionmaker(bind=engine),
+        open_hour=config.open_hour,
+        close_hour=config.close_hour,
+        timezone=pytz.timezone(config.timezone),
+    )
+    return {'store_id': config.store_id, 'orders': orders, 'seconds': time.perf_counter() - started}
+
+def run_chain(stores, days, start_date=None, workers=None):
+    """Simulate every store across a process pool and report aggregate throughput"""
+    os.makedirs(STORES_DIR, exist_ok=True)
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_store, store, days, start_date) for store in stores]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"Store {result['store_id']}: {result['orders']} orders in {result['seconds']:.1f}s")
+    elapsed = time.perf_counter() - started
+    total = sum(r['orders'] for r in results)
+    return {
+        'stores': len(results),
+        'orders': total,
+        'seconds': elapsed,
+        'orders_per_second': total / elapsed if elapsed else 0.0,
+        'results': sorted(results, key=lambda r: r['store_id']),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a chain of coffee shops in parallel.')
+    parser.add_argument('--stores', type=int, default=4, help='number of stores')
+    parser.add_argument('--days', type=int, default=30, help='business days to simulate per store')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat,
+                        help='first simulated day (YYYY-MM-DD); defaults to DAYS before today')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0, help='chain-wide seed for store parameters and RNGs')
+    args = parser.parse_args()
+    summary = run_chain(default_stores(args.stores, args.seed), args.days, args.start_date, args.workers)
+    print(f"Simulated {summary['orders']} orders across {summary['stores']} stores in "
+          f"{summary['seconds']:.1f}s ({summary['orders_per_second']:,.0f} orders/s)")
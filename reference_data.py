@@ -0,0 +1,138 @@
+import random
+import threading
+import numpy as np
+from sqlalchemy import func, select
+from models import Customer, Employee, MenuItem, Inventory, RecipeItem, StaffSchedule
+from staffing import load_roster
+
+# Process-level cache of the id/price vectors used to sample orders, one entry
+# per database. Customers and employees are append-only in practice, so a
+# growing max(id) triggers an incremental load of just the new ids; anything
+# else (price changes, deactivated menu items, recipe edits, deletions) needs
+# invalidate_reference_data(). The shift roster is rebuilt whenever a shift is
+# added.
+_lock = threading.Lock()
+_cache = {}
+
+
+class ReferenceData:
+    """Id and price vectors for customers, employees and active menu items.
+
+    `recipe_matrix[i, j]` is the amount of inventory row `inventory_ids[j]`
+    used by one unit of menu item `menu_item_ids[i]`, and `roster` indexes
+    the staff schedule.
+    """
+
+    def __init__(self, customer_ids, employee_ids, menu_item_ids, menu_item_names, menu_item_prices,
+                 inventory_ids, recipe_matrix, roster, version):
+        self.customer_ids = customer_ids
+        self.employee_ids = employee_ids
+        self.menu_item_ids = menu_item_ids
+        self.menu_item_names = menu_item_names
+        self.menu_item_prices = menu_item_prices
+        self.inventory_ids = inventory_ids
+        self.recipe_matrix = recipe_matrix
+        self.roster = roster
+        self.version = version
+
+    def random_customer_id(self, walk_in_rate=0.2, rng=random):
+        """Random customer id, or None for a walk-in"""
+        if len(self.customer_ids) == 0 or rng.random() <= walk_in_rate:
+            return None
+        return int(self.customer_ids[rng.randrange(len(self.customer_ids))])
+
+    def random_employee_id(self, rng=random, at=None):
+        """Random employee on shift at `at`, or any employee if nobody is scheduled then"""
+        if at is not None:
+            on_shift = self.roster.on_shift(at.replace(tzinfo=None))
+            if len(on_shift):
+                return int(on_shift[rng.randrange(len(on_shift))])
+        if len(self.employee_ids) == 0:
+            return None
+        return int(self.employee_ids[rng.randrange(len(self.employee_ids))])
+
+    def random_menu_items(self, k, rng=random):
+        """Indices of k distinct active menu items"""
+        return rng.sample(range(len(self.menu_item_ids)), min(k, len(self.menu_item_ids)))
+
+
+def _version_query():
+    return select(
+        select(func.max(Customer.id)).scalar_subquery(),
+        select(func.max(Employee.id)).scalar_subquery(),
+        select(func.max(MenuItem.id)).scalar_subquery(),
+        select(func.max(Inventory.id)).scalar_subquery(),
+        select(func.max(RecipeItem.id)).scalar_subquery(),
+        select(func.max(StaffSchedule.id)).scalar_subquery(),
+    )
+
+
+def _load_ids(session, column, after=None):
+    query = select(column).order_by(column)
+    if after is not None:
+        query = query.where(column > after)
+    return np.fromiter(session.execute(query).scalars(), dtype=np.int64)
+
+
+def _load_recipes(session, menu_ids):
+    inventory_ids = _load_ids(session, Inventory.id)
+    recipe_matrix = np.zeros((len(menu_ids), len(inventory_ids)))
+    menu_index = {int(mid): i for i, mid in enumerate(menu_ids)}
+    inventory_index = {int(iid): j for j, iid in enumerate(inventory_ids)}
+    rows = session.execute(select(RecipeItem.menu_item_id, RecipeItem.inventory_id, RecipeItem.quantity)).all()
+    for menu_item_id, inventory_id, quantity in rows:
+        if menu_item_id in menu_index and inventory_id in inventory_index:
+            recipe_matrix[menu_index[menu_item_id], inventory_index[inventory_id]] = quantity
+    return inventory_ids, recipe_matrix
+
+
+def _load(session, version, previous=None):
+    customer_max, employee_max = version[:2]
+    if previous is not None and previous.version[2:5] == version[2:5]:
+        menu_ids, menu_names, menu_prices = previous.menu_item_ids, previous.menu_item_names, previous.menu_item_prices
+        inventory_ids, recipe_matrix = previous.inventory_ids, previous.recipe_matrix
+    else:
+        rows = session.execute(
+            select(MenuItem.id, MenuItem.name, MenuItem.price)
+            .where(MenuItem.is_active.is_(True))
+            .order_by(MenuItem.id)
+        ).all()
+        menu_ids = np.array([r.id for r in rows], dtype=np.int64)
+        menu_names = [r.name for r in rows]
+        menu_prices = np.array([r.price for r in rows], dtype=np.float64)
+        inventory_ids, recipe_matrix = _load_recipes(session, menu_ids)
+
+    if previous is not None and previous.version[0] is not None and customer_max is not None \
+            and customer_max >= previous.version[0]:
+        customer_ids = np.concatenate([previous.customer_ids, _load_ids(session, Customer.id, previous.version[0])])
+    else:
+        customer_ids = _load_ids(session, Customer.id)
+    if previous is not None and previous.version[1] is not None and employee_max is not None \
+            and employee_max >= previous.version[1]:
+        employee_ids = np.concatenate([previous.employee_ids, _load_ids(session, Employee.id, previous.version[1])])
+    else:
+        employee_ids = _load_ids(session, Employee.id)
+    if previous is not None and previous.version[5] == version[5]:
+        roster = previous.roster
+    else:
+        roster = load_roster(session)
+
+    return ReferenceData(customer_ids, employee_ids, menu_ids, menu_names, menu_prices,
+                         inventory_ids, recipe_matrix, roster, version)
+
+
+def get_reference_data(session):
+    """Cached reference data, refreshed when the tables' max ids move"""
+    key = str(session.get_bind().url)
+    version = tuple(session.execute(_version_query()).one())
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None or cached.version != version:
+            cached = _cache[key] = _load(session, version, cached)
+        return cached
+
+
+def invalidate_reference_data():
+    """Drop the cache; call after editing menu prices, recipes or shifts, or removing rows"""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,123 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select, cast, true, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import get_sessionmaker
+from models import Order, OrderItem, HourlySales, DailySales, PaymentMethodSales, MenuItemSales
+from archive import archive_end
+
+ROLLUP_MODELS = (HourlySales, DailySales, PaymentMethodSales, MenuItemSales)
+
+def _upsert(session, model, keys, rows):
+    """Add each row's measures onto the existing rollup row for the same keys"""
+    if not rows:
+        return
+    stmt = sqlite_insert(model)
+    measures = [k for k in rows[0] if k not in keys]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={m: getattr(model, m) + getattr(stmt.excluded, m) for m in measures}
+    )
+    session.execute(stmt, rows)
+
+def record_orders(session, orders, items):
+    """Fold newly written orders into the rollup tables.
+
+    `orders` yields (order_time, total_amount, payment_method) and `items`
+    yields (order_time, menu_item_id, quantity, item_price). Call inside the
+    same transaction that inserts the orders so the rollups stay consistent.
+    """
+    hourly = defaultdict(lambda: [0.0, 0, 0])
+    daily = defaultdict(lambda: [0.0, 0, 0])
+    by_payment = defaultdict(lambda: [0.0, 0])
+    by_item = defaultdict(lambda: [0, 0.0])
+    for order_time, total, payment_method in orders:
+        day = order_time.date()
+        for bucket in (hourly[day, order_time.hour], daily[day]):
+            bucket[0] += total
+            bucket[1] += 1
+        bucket = by_payment[day, payment_method]
+        bucket[0] += total
+        bucket[1] += 1
+    for order_time, menu_item_id, quantity, price in items:
+        day = order_time.date()
+        hourly[day, order_time.hour][2] += quantity
+        daily[day][2] += quantity
+        bucket = by_item[day, menu_item_id]
+        bucket[0] += quantity
+        bucket[1] += quantity * price
+
+    _upsert(session, HourlySales, ['date', 'hour'], [
+        {'date': d, 'hour': h, 'sales': round(s, 2), 'order_count': n, 'items_sold': q}
+        for (d, h), (s, n, q) in hourly.items()
+    ])
+    _upsert(session, DailySales, ['date'], [
+        {'date': d, 'sales': round(s, 2), 'order_count': n, 'items_sold': q}
+        for d, (s, n, q) in daily.items()
+    ])
+    _upsert(session, PaymentMethodSales, ['date', 'payment_method'], [
+        {'date': d, 'payment_method': p, 'sales': round(s, 2), 'order_count': n}
+        for (d, p), (s, n) in by_payment.items()
+    ])
+    _upsert(session, MenuItemSales, ['date', 'menu_item_id'], [
+        {'date': d, 'menu_item_id': m, 'quantity': q, 'revenue': round(r, 2)}
+        for (d, m), (q, r) in by_item.items()
+    ])
+
+def rebuild_rollups(session):
+    """Recompute the rollup tables from the orders already in the database.
+
+    Days in archived months are left alone: their orders are no longer in
+    the live tables, so their rollup rows are the only summary of them.
+    """
+    since = archive_end(session)
+    for model in ROLLUP_MODELS:
+        session.execute(delete(model).where(model.date >= since) if since else delete(model))
+    live = Order.order_time >= datetime.datetime.combine(since, datetime.time.min) if since else true()
+
+    order_day = func.date(Order.order_time)
+    items_per_order = (
+        select(OrderItem.order_id, func.sum(OrderItem.quantity).label('quantity'))
+        .group_by(OrderItem.order_id)
+        .subquery()
+    )
+    per_order = (
+        select(Order.order_time, Order.total_amount, func.coalesce(items_per_order.c.quantity, 0).label('quantity'))
+        .outerjoin(items_per_order, items_per_order.c.order_id == Order.id)
+        .where(live)
+        .subquery()
+    )
+    day, hour = func.date(per_order.c.order_time), cast(func.strftime('%H', per_order.c.order_time), Integer)
+    session.execute(insert(HourlySales).from_select(
+        ['date', 'hour', 'sales', 'order_count', 'items_sold'],
+        select(day, hour, func.round(func.sum(per_order.c.total_amount), 2), func.count(), func.sum(per_order.c.quantity))
+        .group_by(day, hour)
+    ))
+    session.execute(insert(DailySales).from_select(
+        ['date', 'sales', 'order_count', 'items_sold'],
+        select(HourlySales.date, func.round(func.sum(HourlySales.sales), 2),
+               func.sum(HourlySales.order_count), func.sum(HourlySales.items_sold))
+        .where(HourlySales.date >= since if since else true())
+        .group_by(HourlySales.date)
+    ))
+    session.execute(insert(PaymentMethodSales).from_select(
+        ['date', 'payment_method', 'sales', 'order_count'],
+        select(order_day, Order.payment_method, func.round(func.sum(Order.total_amount), 2), func.count())
+        .where(live)
+        .group_by(order_day, Order.payment_method)
+    ))
+    session.execute(insert(MenuItemSales).from_select(
+        ['date', 'menu_item_id', 'quantity', 'revenue'],
+        select(order_day, OrderItem.menu_item_id, func.sum(OrderItem.quantity),
+               func.round(func.sum(OrderItem.quantity * OrderItem.item_price), 2))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(live)
+        .group_by(order_day, OrderItem.menu_item_id)
+    ))
+    session.commit()
+
+if __name__ == '__main__':
+    session = get_sessionmaker()()
+    rebuild_rollups(session)
+    session.close()
+    print('Sales rollups rebuilt!')
@@ -1,42 +1,136 @@
-from sqlalchemy import create_engine
+import argparse
+import time
+import numpy as np
+from sqlalchemy import func
 from sqlalchemy.orm import sessionmaker
-from models import Base, Customer, Employee, StaffSchedule, MenuItem, Inventory, AccountBalance
+from db import get_engine
+from models import Base, Customer, Employee, StaffSchedule, MenuItem, Inventory, RecipeItem
+from ledger import post, shop_now, take_balance_snapshot
+from staffing import SCHEDULE_AHEAD_DAYS, schedule_staff
 from faker import Faker
-import random
 import datetime
 
-def seed_database():
-    """Seed the database with sample data"""
-    engine = create_engine('sqlite:///coffee_shop.db')
-    Session = sessionmaker(bind=engine)
-    session = Session()
+# Inventory used per unit sold: menu item -> [(inventory item, quantity)]
+RECIPES = {
+    'Espresso': [('Espresso Beans', 0.018)],
+    'Latte': [('Espresso Beans', 0.018), ('Milk', 0.25)],
+    'Cappuccino': [('Espresso Beans', 0.018), ('Milk', 0.15)],
+    'Americano': [('Espresso Beans', 0.018)],
+    'Mocha': [('Espresso Beans', 0.018), ('Milk', 0.2), ('Chocolate Syrup', 0.03)],
+    'Tea': [('Tea Leaves', 0.005)],
+    'Hot Chocolate': [('Milk', 0.25), ('Chocolate Syrup', 0.05)],
+    'Croissant': [('Croissants', 1)],
+    'Muffin': [('Muffins', 1)],
+    'Bagel': [('Bagels', 1)],
+}
+
+# Customers are generated in chunks of this many rows, so memory stays flat
+# however many are requested
+CUSTOMER_CHUNK_SIZE = 50000
+# Names come from pools drawn once from Faker; emails and phones embed the
+# row number, so they're unique without Faker's (slow) uniqueness tracking
+NAME_POOL_SIZE = 2000
+SIGNUP_SPAN_SECONDS = 2 * 365 * 86400
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'icloud.com', 'example.com']
+
+def name_pools(seed=None, size=NAME_POOL_SIZE):
+    """Distinct first and last names drawn from a seeded Faker"""
     fake = Faker()
+    fake.seed_instance(seed)
+    first_names = sorted({fake.first_name() for _ in range(size)})
+    last_names = sorted({fake.last_name() for _ in range(size)})
+    return np.array(first_names, dtype=object), np.array(last_names, dtype=object)
+
+def _email_part(name):
+    return ''.join(c for c in name.lower() if c.isalnum())
 
-    # Seed Customers
-    def seed_customers(n=30):
-        customers = []
-        for _ in range(n):
-            customer = Customer(
-                name=fake.name(),
-                email=fake.unique.email(),
-                phone=fake.unique.phone_number(),
-                loyalty_points=random.randint(0, 200)
+CUSTOMER_COLUMNS = ('id', 'name', 'email', 'phone', 'loyalty_points', 'created_at')
+
+def customer_rows(count, rng, first_names, last_names, start_id=1, chunk_size=CUSTOMER_CHUNK_SIZE):
+    """Yield lists of customer row tuples (CUSTOMER_COLUMNS), `chunk_size` at a time.
+
+    created_at is pre-formatted the way SQLAlchemy stores SQLite datetimes,
+    so the rows can go straight to the driver.
+    """
+    today = np.datetime64(datetime.date.today(), 's')
+    first_emails = np.array([_email_part(name) for name in first_names], dtype=object)
+    last_emails = np.array([_email_part(name) for name in last_names], dtype=object)
+    for chunk_start in range(start_id, start_id + count, chunk_size):
+        n = min(chunk_size, start_id + count - chunk_start)
+        ids = range(chunk_start, chunk_start + n)
+        first_idx = rng.integers(0, len(first_names), n)
+        last_idx = rng.integers(0, len(last_names), n)
+        domains = np.array(EMAIL_DOMAINS, dtype=object)[rng.integers(0, len(EMAIL_DOMAINS), n)]
+        loyalty = rng.integers(0, 201, n).tolist()
+        # Sign-ups spread evenly over the last two years in id order, so the
+        # created_at index is appended to rather than scattered into
+        step = SIGNUP_SPAN_SECONDS / count
+        seconds_ago = ((start_id + count - np.arange(chunk_start, chunk_start + n)) * step
+                       - rng.random(n) * step).astype('timedelta64[s]')
+        created = np.datetime_as_string(today - seconds_ago, unit='us')
+        yield [
+            (
+                i,
+                f'{first} {last}',
+                f'{first_email}.{last_email}{i}@{domain}',
+                f'{200 + i // 10000000:03d}-{i // 10000 % 1000:03d}-{i % 10000:04d}',
+                points,
+                created_at.replace('T', ' '),
             )
-            customers.append(customer)
-        session.add_all(customers)
+            for i, first, last, first_email, last_email, domain, points, created_at in zip(
+                ids, first_names[first_idx], last_names[last_idx], first_emails[first_idx], last_emails[last_idx],
+                domains, loyalty, created)
+        ]
+
+def seed_recipes(session):
+    """Link menu items to the inventory they consume, skipping names that don't exist"""
+    menu_items = {m.name: m.id for m in session.query(MenuItem)}
+    inventory = {i.item_name: i.id for i in session.query(Inventory)}
+    recipe_items = [
+        RecipeItem(menu_item_id=menu_items[name], inventory_id=inventory[inv_name], quantity=qty)
+        for name, lines in RECIPES.items() if name in menu_items
+        for inv_name, qty in lines if inv_name in inventory
+    ]
+    session.add_all(recipe_items)
+    session.commit()
+
+def seed_database(engine=None, customers=30, employees=7, days=0, seed=None):
+    """Seed the database with sample data.
+
+    `employees` includes one manager and `days` business days of order
+    history are backfilled after seeding, with staff scheduled for them and
+    the next SCHEDULE_AHEAD_DAYS days. The same `seed` reproduces the same
+    data (dates are relative to today).
+    """
+    Session = sessionmaker(bind=engine or get_engine())
+    session = Session()
+    rng = np.random.default_rng(seed)
+    # Dates follow the shop's clock, like the orders the simulator stamps
+    now = shop_now()
+    history_start = now.date() - datetime.timedelta(days=days)
+    first_names, last_names = name_pools(seed)
+
+    # Seed Customers, streamed in chunks straight to the driver's executemany
+    def seed_customers(n):
+        start_id = (session.query(func.max(Customer.id)).scalar() or 0) + 1
+        sql = (f"INSERT INTO {Customer.__tablename__} ({', '.join(CUSTOMER_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(CUSTOMER_COLUMNS))})")
+        for rows in customer_rows(n, rng, first_names, last_names, start_id):
+            session.connection().exec_driver_sql(sql, rows)
         session.commit()
 
     # Seed Employees
-    def seed_employees():
-        roles = ['Barista', 'Manager', 'Cashier']
+    def seed_employees(n):
+        staff = n - 1
+        headcount = {'Barista': (staff + 1) // 2, 'Manager': 1, 'Cashier': staff // 2}
         employees = []
-        for role in roles:
-            for _ in range(3 if role != 'Manager' else 1):
+        for role, count in headcount.items():
+            for _ in range(count):
                 employee = Employee(
-                    name=fake.name(),
+                    name=f'{rng.choice(first_names)} {rng.choice(last_names)}',
                     role=role,
-                    hourly_wage=round(random.uniform(15, 25) if role != 'Manager' else 30, 2),
-                    hire_date=fake.date_between(start_date='-2y', end_date='today')
+                    hourly_wage=round(float(rng.uniform(15, 25)) if role != 'Manager' else 30, 2),
+                    hire_date=datetime.date.today() - datetime.timedelta(days=int(rng.integers(0, 2 * 365)))
                 )
                 employees.append(employee)
         session.add_all(employees)
@@ -62,37 +156,58 @@ def seed_database():
 
     # Seed Inventory
     def seed_inventory():
+        # (name, on hand, reorder level, unit, restock level, unit cost, lead time in days)
         inventory_items = [
-            ('Espresso Beans', 20, 5, 'kg'),
-            ('Milk', 30, 10, 'L'),
-            ('Tea Leaves', 10, 2, 'kg'),
-            ('Chocolate Syrup', 5, 2, 'L'),
-            ('Croissants', 15, 5, 'pcs'),
-            ('Muffins', 15, 5, 'pcs'),
-            ('Bagels', 15, 5, 'pcs'),
+            ('Espresso Beans', 20, 5, 'kg', 20, 2.0, 0),
+            ('Milk', 30, 10, 'L', 20, 2.0, 0),
+            ('Tea Leaves', 10, 2, 'kg', 20, 2.0, 0),
+            ('Chocolate Syrup', 5, 2, 'L', 20, 2.0, 0),
+            ('Croissants', 15, 5, 'pcs', 20, 1.0, 0),
+            ('Muffins', 15, 5, 'pcs', 20, 0.8, 0),
+            ('Bagels', 15, 5, 'pcs', 20, 0.7, 0),
+        ]
+        inventory = [
+            Inventory(item_name=name, quantity_on_hand=qty, reorder_level=reorder, unit=unit,
+                      restock_level=restock, unit_cost=unit_cost, lead_time_days=lead_time)
+            for name, qty, reorder, unit, restock, unit_cost, lead_time in inventory_items
         ]
-        inventory = [Inventory(item_name=name, quantity_on_hand=qty, reorder_level=reorder, unit=unit) for name, qty, reorder, unit in inventory_items]
         session.add_all(inventory)
         session.commit()
 
-    # Seed Account Balance
+    # Seed Staff Schedules from today; backfill schedules the days it generates
+    def seed_staff_schedules():
+        from simulate_transactions import OPEN_HOUR, CLOSE_HOUR
+        schedule_staff(session, now.date(), SCHEDULE_AHEAD_DAYS, OPEN_HOUR, CLOSE_HOUR)
+        session.commit()
+
+    # Seed Account Balance, opened before any backfilled history so its closes include it
     def seed_account_balance():
-        balance = AccountBalance(
-            date=datetime.date.today(),
-            balance=round(random.uniform(1000, 5000), 2),
-            notes='Initial seed balance.'
-        )
-        session.add(balance)
+        opened_at = datetime.datetime.combine(history_start, datetime.time.min) if days else now
+        post(session, round(float(rng.uniform(1000, 5000)), 2), 'opening', posted_at=opened_at)
+        take_balance_snapshot(session, as_of=opened_at, notes='Initial seed balance.')
         session.commit()
 
     # Run all seeding functions
-    seed_customers()
-    seed_employees()
+    seed_customers(customers)
+    seed_employees(employees)
+    seed_staff_schedules()
     seed_menu_items()
     seed_inventory()
+    seed_recipes(session)
     seed_account_balance()
     session.close()
 
+    if days:
+        from simulate_transactions import backfill
+        backfill(days, start_date=history_start, seed=seed, session_factory=Session)
+
 if __name__ == '__main__':
-    seed_database()
-    print('Database seeded with sample data!') 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Seed the coffee shop database with sample data.')
+    parser.add_argument('--customers', type=int, default=30, help='number of customers')
+    parser.add_argument('--employees', type=int, default=7, help='number of employees, including one manager')
+    parser.add_argument('--days', type=int, default=0, help='business days of order history to backfill')
+    parser.add_argument('--seed', type=int, help='random seed for reproducible data')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    seed_database(customers=args.customers, employees=args.employees, days=args.days, seed=args.seed)
+    print(f'Database seeded with sample data in {time.perf_counter() - started:.1f}s!')
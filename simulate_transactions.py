@@ -1,13 +1,24 @@
+import argparse
 import random
+import threading
 import time
 import datetime
+import numpy as np
 import pytz
-from sqlalchemy import create_engine
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import sessionmaker
-from models import Customer, Employee, MenuItem, Order, OrderItem, Inventory, AccountBalance
+from db import get_engine
+from models import Order, OrderItem
+from reference_data import get_reference_data
+from inventory import deplete_inventory, place_reorders, receive_purchase_orders
+from rollups import record_orders
+from ledger import post, post_many, close_business_day
+from staffing import SCHEDULE_AHEAD_DAYS, schedule_staff
+from loyalty import accrue_points
+from sql_profiling import profile
 
 # Set up database
-engine = create_engine('sqlite:///coffee_shop.db')
+engine = get_engine()
 Session = sessionmaker(bind=engine)
 
 # Business hours
@@ -18,94 +29,296 @@ TIMEZONE = pytz.timezone('US/Eastern')
 # Payment methods
 PAYMENT_METHODS = ['cash', 'card', 'mobile']
 
+# Backfill defaults (the live loop averages one order every ~20 seconds)
+BACKFILL_ORDERS_PER_HOUR = 180
+
 def is_business_open(now=None):
     now = now or datetime.datetime.now(TIMEZONE)
     return OPEN_HOUR <= now.hour < CLOSE_HOUR
 
-def simulate_transaction():
-    session = Session()
-    # Get random customer (or None for walk-in)
-    customers = session.query(Customer).all()
-    customer = random.choice(customers) if customers and random.random() > 0.2 else None
-    # Get random employee
-    employees = session.query(Employee).all()
-    employee = random.choice(employees) if employees else None
-    # Get random menu items (1-3 per order)
-    menu_items = session.query(MenuItem).filter_by(is_active=True).all()
-    num_items = random.randint(1, 3)
-    items = random.sample(menu_items, num_items)
-    # Create order
-    order = Order(
-        customer_id=customer.id if customer else None,
-        employee_id=employee.id if employee else None,
-        order_time=datetime.datetime.now(TIMEZONE),
-        total_amount=0.0,
-        payment_method=random.choice(PAYMENT_METHODS)
-    )
-    session.add(order)
-    session.flush()  # Get order.id
-    total = 0.0
-    for item in items:
-        quantity = random.randint(1, 3)
-        order_item = OrderItem(
-            order_id=order.id,
-            menu_item_id=item.id,
-            quantity=quantity,
-            item_price=item.price
-        )
-        session.add(order_item)
-        total += item.price * quantity
-        # Update inventory (if tracked)
-        inv = session.query(Inventory).filter(Inventory.item_name.ilike(f'%{item.name}%')).first()
-        if inv:
-            inv.quantity_on_hand = max(0, inv.quantity_on_hand - quantity)
-    order.total_amount = round(total, 2)
-    # Update account balance
-    account = session.query(AccountBalance).order_by(AccountBalance.date.desc()).first()
-    if account:
-        account.balance += order.total_amount
+def draw_order(refs, order_time, rng=random):
+    """Pick a customer (or walk-in), an on-shift employee, payment method and 1-3 menu items of 1-3 units"""
+    items = refs.random_menu_items(rng.randint(1, 3), rng)
+    return {
+        'order_time': order_time,
+        'customer_id': refs.random_customer_id(rng=rng),
+        'employee_id': refs.random_employee_id(rng, at=order_time),
+        'payment_method': rng.choice(PAYMENT_METHODS),
+        'items': items,
+        'quantities': [rng.randint(1, 3) for _ in items],
+    }
+
+def write_orders(session, refs, orders, verbose=True):
+    """Write drawn orders in the caller's transaction and return their ids.
+
+    Orders and items go in as two executemany inserts with client-assigned
+    ids (safe because the writer engine's immediate transaction holds the
+    write lock), and inventory usage, receipts and reorders are applied once
+    for the whole batch.
+    """
+    if not orders:
+        return []
+    first_id = (session.execute(select(func.max(Order.id))).scalar() or 0) + 1
+    order_rows, item_rows, rollup_items, ledger_entries = [], [], [], []
+    units_sold = np.zeros(len(refs.menu_item_ids))
+    for order_id, order in enumerate(orders, first_id):
+        order_time = order['order_time'].replace(tzinfo=None)
+        total = 0.0
+        for i, quantity in zip(order['items'], order['quantities']):
+            menu_item_id = int(refs.menu_item_ids[i])
+            price = float(refs.menu_item_prices[i])
+            item_rows.append({'order_id': order_id, 'menu_item_id': menu_item_id, 'quantity': quantity, 'item_price': price})
+            rollup_items.append((order_time, menu_item_id, quantity, price))
+            units_sold[i] += quantity
+            total += price * quantity
+        total = round(total, 2)
+        order_rows.append({
+            'id': order_id, 'customer_id': order['customer_id'], 'employee_id': order['employee_id'],
+            'order_time': order_time, 'total_amount': total, 'payment_method': order['payment_method'],
+        })
+        ledger_entries.append({'posted_at': order_time, 'amount': total, 'kind': 'order', 'reference_id': order_id, 'notes': None})
+
+    session.execute(insert(Order), order_rows)
+    if item_rows:
+        session.execute(insert(OrderItem), item_rows)
+    record_orders(session, [(r['order_time'], r['total_amount'], r['payment_method']) for r in order_rows], rollup_items)
+    # Update inventory from the recipes of every basket in the batch
+    latest = max(r['order_time'] for r in order_rows)
+    receive_purchase_orders(session, latest)
+    low_stock = deplete_inventory(session, dict(zip(refs.inventory_ids.tolist(), (units_sold @ refs.recipe_matrix).tolist())))
+    # Record the revenue in the cash ledger and the customers' loyalty points
+    post_many(session, ledger_entries)
+    accrue_points(session, [(r['customer_id'], r['total_amount']) for r in order_rows])
+    # Reorder any item the batch pushed below its reorder level
+    place_reorders(session, low_stock, now=latest, verbose=verbose)
+    return [r['id'] for r in order_rows]
+
+def simulate_transaction(session_factory=None, order_time=None, verbose=True):
+    """Simulate a single transaction (placed now unless `order_time` is given) and return the new order id"""
+    session = (session_factory or Session)()
+    with profile() as stats:
+        try:
+            refs = get_reference_data(session)
+            order_time = order_time or datetime.datetime.now(TIMEZONE)
+            [order_id] = write_orders(session, refs, [draw_order(refs, order_time)], verbose)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    if verbose:
+        print(f"Added order {order_id} at {order_time.strftime('%Y-%m-%d %H:%M:%S')} ({stats.summary()})")
+        for statement, count in stats.n_plus_one():
+            print(f'Possible N+1: ran {count} times: {statement}')
+    return order_id
+
+def close_day(now=None, session_factory=None):
+    """Close the most recent business day that has ended (payroll and balance snapshot).
+
+    Also keeps the next SCHEDULE_AHEAD_DAYS days scheduled.
+    """
+    now = now or datetime.datetime.now(TIMEZONE)
+    day = now.date() if now.hour >= CLOSE_HOUR else now.date() - datetime.timedelta(days=1)
+    session = (session_factory or Session)()
+    try:
+        if close_business_day(session, day, datetime.datetime.combine(day, datetime.time(CLOSE_HOUR))):
+            print(f'Closed business day {day}')
+        schedule_staff(session, day + datetime.timedelta(days=1), SCHEDULE_AHEAD_DAYS, OPEN_HOUR, CLOSE_HOUR)
+        session.commit()
+    finally:
+        session.close()
+
+class SimulationWorker(threading.Thread):
+    """Background thread generating orders at a Poisson arrival rate while the shop is open.
+
+    Lets a long-running process (e.g. the dashboard) keep the simulation
+    going without tying writes to page renders.
+    """
+
+    def __init__(self, session_factory=None, orders_per_minute=3.0):
+        super().__init__(name='simulation-worker', daemon=True)
+        self.session_factory = session_factory
+        self.orders_per_minute = orders_per_minute
+        self.orders_created = 0
+        self.errors = 0
+        self.last_order_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.orders_per_minute <= 0 or not is_business_open():
+                try:
+                    close_day(session_factory=self.session_factory)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                self._stop_event.wait(60)
+                continue
+            try:
+                simulate_transaction(self.session_factory)
+                self.orders_created += 1
+                self.last_order_at = time.time()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            self._stop_event.wait(random.expovariate(self.orders_per_minute / 60))
+
+def _simulate_day(rng, day, orders_per_hour, customer_ids, employee_ids, item_prices,
+                  open_hour=OPEN_HOUR, close_hour=CLOSE_HOUR, roster=None):
+    """Draw one business day of orders as NumPy arrays.
+
+    Orders go to an employee on shift in `roster` at the order time, or
+    any of `employee_ids` if nobody is scheduled then.
+    """
+    hours = np.arange(open_hour, close_hour)
+    counts = rng.poisson(orders_per_hour, size=len(hours))
+    n = int(counts.sum())
+    # Arrival times: uniform within each hour, sorted so ids follow time
+    seconds = np.sort(np.repeat((hours - open_hour) * 3600, counts) + rng.integers(0, 3600, n))
+    opening = np.datetime64(day) + np.timedelta64(open_hour, 'h')
+    order_times = (opening + seconds.astype('timedelta64[s]')).astype('datetime64[us]')
+
+    # Basket: 1-3 distinct menu items per order, 1-3 units each
+    max_items = min(3, len(item_prices))
+    sizes = rng.integers(1, max_items + 1, n)
+    picks = np.argsort(rng.random((n, len(item_prices))), axis=1)[:, :max_items]
+    mask = np.arange(max_items) < sizes[:, None]
+    line_order = np.nonzero(mask)[0]
+    line_item = picks[mask]
+    line_qty = rng.integers(1, 4, len(line_item))
+    line_price = item_prices[line_item]
+    totals = np.round(np.bincount(line_order, weights=line_price * line_qty, minlength=n), 2)
+
+    # Customer (20% walk-ins), on-shift employee and payment method
+    if len(customer_ids):
+        customers = customer_ids[rng.integers(0, len(customer_ids), n)].astype(object)
+        customers[rng.random(n) <= 0.2] = None
+    else:
+        customers = np.full(n, None, dtype=object)
+    if roster is not None:
+        employees = roster.assign(order_times, rng, employee_ids)
+    elif len(employee_ids):
+        employees = employee_ids[rng.integers(0, len(employee_ids), n)].astype(object)
+    else:
+        employees = np.full(n, None, dtype=object)
+    payments = np.array(PAYMENT_METHODS, dtype=object)[rng.integers(0, len(PAYMENT_METHODS), n)]
+
+    return {
+        'order_times': order_times,
+        'customers': customers,
+        'employees': employees,
+        'payments': payments,
+        'totals': totals,
+        'line_order': line_order,
+        'line_item': line_item,
+        'line_qty': line_qty,
+        'line_price': line_price,
+    }
+
+def backfill(days, start_date=None, orders_per_hour=BACKFILL_ORDERS_PER_HOUR, seed=None, session_factory=None,
+             open_hour=OPEN_HOUR, close_hour=CLOSE_HOUR, timezone=TIMEZONE):
+    """Generate `days` simulated business days of history in one run.
+
+    Each simulated day's orders and order items are bulk-inserted in one
+    transaction, with rollups, inventory usage, reorders, ledger entries and
+    loyalty points applied once per day in aggregate before the day is closed.
+    Days without shifts are scheduled first, so orders go to staff on shift
+    and each day's close posts its payroll.
+    History ends yesterday (in `timezone`) unless `start_date` is given.
+    Returns the number of orders written.
+    """
+    session = (session_factory or Session)()
+    rng = np.random.default_rng(seed)
+    if start_date is None:
+        start_date = datetime.datetime.now(timezone).date() - datetime.timedelta(days=days)
+    schedule_staff(session, start_date, days, open_hour, close_hour)
     session.commit()
-    order_id = order.id
-    order_time = order.order_time
-
-    # Reorder inventory if needed
-    for inv in session.query(Inventory).all():
-        if inv.quantity_on_hand <= inv.reorder_level:
-            # Determine average price per unit (use MenuItem cost if available, else $2/unit)
-            menu_item = session.query(MenuItem).filter_by(name=inv.item_name.rstrip('s')).first()
-            avg_price = menu_item.cost if menu_item else 2.0
-            restock_qty = 20
-            reorder_amount = restock_qty - inv.quantity_on_hand
-            if reorder_amount > 0:
-                inv.quantity_on_hand = restock_qty
-                reorder_cost = reorder_amount * avg_price
-                account = session.query(AccountBalance).order_by(AccountBalance.date.desc()).first()
-                if account:
-                    account.balance -= reorder_cost
-                session.commit()
-                print(f"Reordered {reorder_amount} {inv.item_name} at ${avg_price:.2f}/unit. Total cost: ${reorder_cost:.2f}")
-                with open('reorder_log.txt', 'a') as logf:
-                    logf.write(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Reordered {reorder_amount} {inv.item_name} at ${avg_price:.2f}/unit. Total cost: ${reorder_cost:.2f}\n")
+
+    refs = get_reference_data(session)
+    if len(refs.menu_item_ids) == 0:
+        session.close()
+        raise ValueError('No active menu items to simulate orders from')
+    customer_ids, employee_ids = refs.customer_ids, refs.employee_ids
+    item_ids, item_prices = refs.menu_item_ids, refs.menu_item_prices
+
+    written = 0
+    for day_offset in range(days):
+        day = start_date + datetime.timedelta(days=day_offset)
+        sim = _simulate_day(rng, day, orders_per_hour, customer_ids, employee_ids, item_prices, open_hour, close_hour,
+                            refs.roster)
+        n = len(sim['totals'])
+        # Read in the day's immediate transaction, so ids stay unique when the
+        # live simulator writes orders between backfilled days
+        next_order_id = (session.execute(select(func.max(Order.id))).scalar() or 0) + 1
+        order_ids = np.arange(next_order_id, next_order_id + n)
+        order_times = sim['order_times'].tolist()
+        line_times = sim['order_times'][sim['line_order']].tolist()
+        line_items = item_ids[sim['line_item']].tolist()
+
+        # One transaction per simulated day: orders, items, rollups, inventory and balance
+        session.execute(insert(Order), [
+            {'id': oid, 'customer_id': cid, 'employee_id': eid, 'order_time': t,
+             'total_amount': total, 'payment_method': pay}
+            for oid, cid, eid, t, total, pay in zip(
+                order_ids.tolist(), sim['customers'].tolist(), sim['employees'].tolist(),
+                order_times, sim['totals'].tolist(), sim['payments'].tolist())
+        ])
+        session.execute(insert(OrderItem), [
+            {'order_id': oid, 'menu_item_id': mid, 'quantity': qty, 'item_price': price}
+            for oid, mid, qty, price in zip(
+                order_ids[sim['line_order']].tolist(), line_items,
+                sim['line_qty'].tolist(), sim['line_price'].tolist())
+        ])
+        record_orders(
+            session,
+            zip(order_times, sim['totals'].tolist(), sim['payments'].tolist()),
+            zip(line_times, line_items, sim['line_qty'].tolist(), sim['line_price'].tolist())
+        )
+
+        # Aggregate inventory usage and revenue for the day
+        units_sold = np.bincount(sim['line_item'], weights=sim['line_qty'], minlength=len(item_ids))
+        usage = units_sold @ refs.recipe_matrix
+        opening = datetime.datetime.combine(day, datetime.time(open_hour))
+        receive_purchase_orders(session, opening)
+        low_stock = deplete_inventory(session, dict(zip(refs.inventory_ids.tolist(), usage.tolist())))
+        closing = datetime.datetime.combine(day, datetime.time(close_hour))
+        post(session, float(sim['totals'].sum()), 'order', posted_at=closing, notes=f'{n} backfilled orders')
+        accrue_points(session, zip(sim['customers'].tolist(), sim['totals'].tolist()))
+        place_reorders(session, low_stock, now=closing, verbose=False)
+        close_business_day(session, day, closing)
+        session.commit()
+        written += n
 
     session.close()
-    print(f"Added order {order_id} at {order_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    return written
 
-def main():
+def main(orders_per_hour=BACKFILL_ORDERS_PER_HOUR):
+    """Simulate one register in real time, following the hourly demand curve"""
+    import asyncio
+    from arrivals import ArrivalScheduler
     print('Starting transaction simulation...')
-    while True:
-        now = datetime.datetime.now(TIMEZONE)
-        if is_business_open(now):
-            simulate_transaction()
-            time.sleep(random.randint(10, 30))  # Wait 10-30 seconds between transactions
-        else:
-            print('Business is closed. Waiting for opening hour...')
-            # Sleep until next open hour
-            tomorrow = now + datetime.timedelta(days=1)
-            next_open = now.replace(hour=OPEN_HOUR, minute=0, second=0, microsecond=0)
-            if now.hour >= CLOSE_HOUR:
-                next_open = tomorrow.replace(hour=OPEN_HOUR, minute=0, second=0, microsecond=0)
-            sleep_seconds = (next_open - now).total_seconds()
-            time.sleep(max(60, sleep_seconds))
+    asyncio.run(ArrivalScheduler(orders_per_hour=orders_per_hour, verbose=True).run())
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Simulate coffee shop transactions.')
+    parser.add_argument('--backfill', type=int, metavar='DAYS',
+                        help='generate DAYS business days of history and exit')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat,
+                        help='first backfilled day (YYYY-MM-DD); defaults to DAYS before today')
+    parser.add_argument('--orders-per-hour', type=float, default=BACKFILL_ORDERS_PER_HOUR,
+                        help='mean arrival rate while the shop is open')
+    parser.add_argument('--seed', type=int, help='random seed for reproducible backfills')
+    args = parser.parse_args()
+    if args.backfill:
+        started = time.perf_counter()
+        count = backfill(args.backfill, start_date=args.start_date,
+                         orders_per_hour=args.orders_per_hour, seed=args.seed)
+        elapsed = time.perf_counter() - started
+        print(f'Backfilled {count} orders over {args.backfill} days in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} orders/s)')
+    else:
+        main(args.orders_per_hour)
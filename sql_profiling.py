@@ -0,0 +1,114 @@
+import collections
+import contextlib
+import contextvars
+import threading
+import time
+import weakref
+from sqlalchemy import event
+
+# SQL instrumentation on engine events. Every engine from db.py is
+# instrumented, but statements are only recorded inside profile() blocks, so
+# unprofiled code pays for one context-variable lookup per statement.
+
+# The same SELECT run this many times in one profile is flagged as a likely
+# N+1 pattern (e.g. session.get() in a loop instead of one joined query)
+N_PLUS_ONE_THRESHOLD = 5
+
+_active = contextvars.ContextVar('sql_profiles', default=())
+_instrumented = weakref.WeakSet()
+
+class QueryStats:
+    """Statement count, SQL time and rows fetched for a profiled block of code"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = 0
+            self.total_seconds = 0.0
+            self.slowest_seconds = 0.0
+            self.slowest_statement = None
+            self.rows = 0
+            self.by_statement = collections.Counter()
+
+    def record(self, statement, seconds):
+        with self._lock:
+            self.statements += 1
+            self.total_seconds += seconds
+            if seconds > self.slowest_seconds:
+                self.slowest_seconds = seconds
+                self.slowest_statement = statement
+            self.by_statement[statement] += 1
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """[(statement, times run)] for SELECTs repeated at least `threshold` times"""
+        return [
+            (statement, count) for statement, count in self.by_statement.most_common()
+            if count >= threshold and statement.lstrip().upper().startswith('SELECT')
+        ]
+
+    def summary(self):
+        return (f'{self.statements} SQL statements, {self.total_seconds * 1000:.1f} ms in SQL '
+                f'(slowest {self.slowest_seconds * 1000:.1f} ms), {self.rows} rows')
+
+class _RowCounter:
+    # Installed as the cursor's row_factory, so it sees every fetched row;
+    # also carries the statement's profiles and start time to after_cursor_execute
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.started = time.perf_counter()
+
+    def __call__(self, cursor, row):
+        for stats in self.profiles:
+            stats.rows += 1
+        return row
+
+@contextlib.contextmanager
+def profile(stats=None):
+    """Record SQL run in this block (in this thread or task) into `stats`, or a new QueryStats.
+
+    Profiles nest: a statement is recorded into every enclosing profile.
+    """
+    stats = stats if stats is not None else QueryStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+def start_profile(stats=None):
+    """Start a top-level profile for code that can't sit in a with block (e.g. a Streamlit script).
+
+    Replaces whatever profiles are active in this context, so a run that
+    never reached stop_profile() doesn't leak into the next. Returns
+    (stats, token); pass the token to stop_profile().
+    """
+    stats = stats if stats is not None else QueryStats()
+    return stats, _active.set((stats,))
+
+def stop_profile(token):
+    _active.reset(token)
+
+def instrument(engine):
+    """Attach the profiling listeners to an engine (once)"""
+    if engine in _instrumented:
+        return engine
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profiles = _active.get()
+        if profiles:
+            cursor.row_factory = _RowCounter(profiles)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = cursor.row_factory
+        if isinstance(counter, _RowCounter):
+            seconds = time.perf_counter() - counter.started
+            for stats in counter.profiles:
+                stats.record(statement, seconds)
+
+    return engine
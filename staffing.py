@@ -0,0 +1,159 @@
+import argparse
+import bisect
+import datetime
+import time
+import numpy as np
+from sqlalchemy import insert, select
+from models import Employee, StaffSchedule
+
+# Staff schedules: a bulk shift generator and an in-memory index of who is on
+# shift when, used to assign orders to employees who are actually working
+
+# Days ahead the live simulation keeps scheduled (see simulate_transactions.close_day)
+SCHEDULE_AHEAD_DAYS = 14
+# Everyone gets this many consecutive days off a week, staggered across the team
+DAYS_OFF_PER_WEEK = 2
+# Managers work a middle shift starting and ending this many hours inside opening hours
+MANAGER_INSET_HOURS = 2
+
+class ShiftRoster:
+    """Interval index over shifts answering "who is on shift at time t".
+
+    Shift starts and ends are merged into one sorted list of boundaries.
+    The set of employees on shift is constant between consecutive
+    boundaries, so it is precomputed per segment (as slices of one id
+    array) and a lookup is a single binary search. Build one with
+    load_roster() and rebuild it when the schedule changes.
+    """
+
+    def __init__(self, employee_ids, starts, ends):
+        employee_ids = np.asarray(employee_ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype='datetime64[s]')
+        ends = np.asarray(ends, dtype='datetime64[s]')
+        self.boundaries = np.unique(np.concatenate([starts, ends]))
+        self._boundary_list = self.boundaries.tolist()
+        # A shift covers the segments from its start boundary up to (not
+        # including) its end boundary; expand to (segment, employee) pairs
+        first = np.searchsorted(self.boundaries, starts)
+        spans = np.searchsorted(self.boundaries, ends) - first
+        segments = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        pairs = np.unique(np.stack([segments, np.repeat(employee_ids, spans)], axis=1), axis=0)
+        self.members = pairs[:, 1]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(pairs[:, 0], minlength=len(self.boundaries)))])
+        self.shifts = len(employee_ids)
+
+    def on_shift(self, at):
+        """Ids of the employees on shift at naive datetime `at`"""
+        k = bisect.bisect_right(self._boundary_list, at) - 1
+        if k < 0:
+            return self.members[:0]
+        return self.members[self.offsets[k]:self.offsets[k + 1]]
+
+    def assign(self, times, rng, fallback):
+        """Pick an on-shift employee for each datetime64 in `times`.
+
+        Times nobody is scheduled for get a random id from `fallback`
+        instead (None if that's empty). `rng` is a NumPy Generator.
+        """
+        k = np.searchsorted(self.boundaries, np.asarray(times, dtype='datetime64[s]'), side='right') - 1
+        counts = np.zeros(len(k), dtype=np.int64)
+        scheduled = k >= 0
+        counts[scheduled] = self.offsets[k[scheduled] + 1] - self.offsets[k[scheduled]]
+        picks = np.full(len(k), None, dtype=object)
+        staffed = counts > 0
+        if staffed.any():
+            chosen = self.offsets[k[staffed]] + (rng.random(staffed.sum()) * counts[staffed]).astype(np.int64)
+            picks[staffed] = self.members[chosen]
+        if len(fallback) and not staffed.all():
+            picks[~staffed] = fallback[rng.integers(0, len(fallback), (~staffed).sum())]
+        return picks
+
+def load_roster(session):
+    """A ShiftRoster over every row of the staff schedule"""
+    rows = session.execute(
+        select(StaffSchedule.employee_id, StaffSchedule.shift_date, StaffSchedule.shift_start, StaffSchedule.shift_end)
+    ).all()
+    employee_ids, starts, ends = [], [], []
+    for employee_id, day, shift_start, shift_end in rows:
+        start = datetime.datetime.combine(day, shift_start)
+        end = datetime.datetime.combine(day, shift_end)
+        # A shift ending at or before its start runs past midnight
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        employee_ids.append(employee_id)
+        starts.append(start)
+        ends.append(end)
+    return ShiftRoster(employee_ids, starts, ends)
+
+def shift_times(role, slot, open_hour, close_hour):
+    """(start, end) of a role's shift; baristas and cashiers split the day into two slots"""
+    if role == 'Manager':
+        return datetime.time(open_hour + MANAGER_INSET_HOURS), datetime.time(close_hour - MANAGER_INSET_HOURS)
+    midday = datetime.time((open_hour + close_hour) // 2)
+    return (datetime.time(open_hour), midday) if slot == 0 else (midday, datetime.time(close_hour))
+
+def shift_coverage(role, open_hour, close_hour):
+    """Expected share of a role's staff on shift in each hour of the day (24 values) under schedule_staff()'s pattern.
+
+    Averages over the weekly rotation: each employee works
+    7 - DAYS_OFF_PER_WEEK days a week and baristas and cashiers spend
+    alternate weeks on each slot.
+    """
+    hours = np.arange(24)
+    slots = [shift_times(role, slot, open_hour, close_hour) for slot in (0, 1)]
+    on_shift = np.mean([(hours >= start.hour) & (hours < end.hour) for start, end in slots], axis=0)
+    return on_shift * (7 - DAYS_OFF_PER_WEEK) / 7
+
+def schedule_staff(session, start_date, days, open_hour, close_hour):
+    """Generate shifts for `days` days from `start_date`, skipping days already scheduled.
+
+    Baristas and cashiers alternate weekly between an opening shift (open to
+    midday) and a closing one (midday to close), and managers work a middle
+    shift. Everyone takes DAYS_OFF_PER_WEEK consecutive days off, staggered
+    by employee so the team's days off are spread across the week. Nobody is
+    scheduled before their hire date. Runs in the caller's transaction and
+    returns the number of shifts added.
+    """
+    end_date = start_date + datetime.timedelta(days=days - 1)
+    scheduled = set(session.execute(
+        select(StaffSchedule.shift_date).where(StaffSchedule.shift_date.between(start_date, end_date)).distinct()
+    ).scalars())
+    dates = [start_date + datetime.timedelta(days=d) for d in range(days)]
+    dates = [day for day in dates if day not in scheduled]
+    employees = session.execute(select(Employee.id, Employee.role, Employee.hire_date).order_by(Employee.id)).all()
+    if not dates or not employees:
+        return 0
+
+    rows = []
+    for i, employee in enumerate(employees):
+        for day in dates:
+            if employee.hire_date and day < employee.hire_date:
+                continue
+            ordinal = day.toordinal()
+            if (ordinal + i) % 7 < DAYS_OFF_PER_WEEK:
+                continue
+            shift_start, shift_end = shift_times(employee.role, (ordinal // 7 + i) % 2, open_hour, close_hour)
+            rows.append({'employee_id': employee.id, 'shift_date': day, 'shift_start': shift_start, 'shift_end': shift_end})
+    if rows:
+        session.execute(insert(StaffSchedule), rows)
+    return len(rows)
+
+if __name__ == '__main__':
+    from simulate_transactions import OPEN_HOUR, CLOSE_HOUR, TIMEZONE, Session
+    parser = argparse.ArgumentParser(description='Generate staff shifts for days not yet scheduled.')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat,
+                        help='first day to schedule (YYYY-MM-DD); defaults to today')
+    parser.add_argument('--days', type=int, default=SCHEDULE_AHEAD_DAYS, help='number of days to schedule')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    session = Session()
+    try:
+        added = schedule_staff(session, args.start_date or datetime.datetime.now(TIMEZONE).date(), args.days,
+                               OPEN_HOUR, CLOSE_HOUR)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    print(f'Scheduled {added} shifts in {time.perf_counter() - started:.1f}s')
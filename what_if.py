@@ -0,0 +1,300 @@
+import argparse
+import dataclasses
+import datetime
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sqlalchemy import func, select
+from db import get_sessionmaker
+from models import MenuItem, Inventory, RecipeItem, Employee, DailySales, HourlySales, MenuItemSales
+from ledger import current_balance
+from arrivals import DEMAND_CURVE
+from staffing import shift_coverage
+from simulate_transactions import OPEN_HOUR, CLOSE_HOUR, BACKFILL_ORDERS_PER_HOUR
+
+# Monte Carlo what-if engine: scenario inputs are read once from the database
+# (read-only) and every simulated day runs in memory, vectorized across runs.
+
+# Demand and basket size are estimated from this many days of rollups
+LOOKBACK_DAYS = 28
+UNITS_PER_ORDER = 4.0  # fallback: 1-3 items of 1-3 units
+# Orders one barista or cashier can serve per hour; demand beyond the
+# on-shift capacity is lost. Managers don't serve. Who is on shift follows
+# staffing.schedule_staff()'s rotation. The rate is calibrated from the
+# busiest hours in the lookback; this is the fallback without history.
+ORDERS_PER_STAFF_HOUR = 60
+SERVING_ROLES = ('Barista', 'Cashier')
+# Unit demand for an item scales with (new price / old price) ** elasticity
+PRICE_ELASTICITY = -0.8
+PERCENTILES = (5, 50, 95)
+
+@dataclasses.dataclass
+class ScenarioInputs:
+    """Everything a simulated day needs, as plain arrays (picklable for worker processes)"""
+    item_names: list
+    prices: np.ndarray
+    popularity: np.ndarray  # share of units sold per menu item
+    recipe: np.ndarray  # [menu item, inventory item] amount per unit sold
+    inventory_names: list
+    on_hand: np.ndarray
+    reorder_level: np.ndarray
+    restock_level: np.ndarray
+    unit_cost: np.ndarray
+    lead_time_days: np.ndarray
+    staff: dict  # role -> (headcount, mean hourly wage)
+    shift_coverage: dict  # role -> expected share of its staff on shift in each hour of the day
+    orders_per_staff_hour: float
+    orders_per_hour: float
+    units_per_order: float
+    hourly_curve: np.ndarray  # relative demand for each hour of the day
+    opening_cash: float
+
+@dataclasses.dataclass
+class Scenario:
+    name: str = 'baseline'
+    prices: dict = dataclasses.field(default_factory=dict)  # menu item -> new price
+    staff: dict = dataclasses.field(default_factory=dict)  # role -> headcount change
+    reorder_levels: dict = dataclasses.field(default_factory=dict)  # inventory item -> level
+    restock_levels: dict = dataclasses.field(default_factory=dict)  # inventory item -> level
+    demand_multiplier: float = 1.0
+
+def load_inputs(session, today=None, lookback_days=LOOKBACK_DAYS):
+    """Read the current menu, recipes, inventory rules, staff and recent demand"""
+    today = today or datetime.date.today()
+    since = today - datetime.timedelta(days=lookback_days)
+    menu = session.execute(
+        select(MenuItem.id, MenuItem.name, MenuItem.price).where(MenuItem.is_active.is_(True)).order_by(MenuItem.id)
+    ).all()
+    inventory = session.execute(select(Inventory).order_by(Inventory.id)).scalars().all()
+    menu_index = {row.id: i for i, row in enumerate(menu)}
+    inventory_index = {inv.id: j for j, inv in enumerate(inventory)}
+    recipe = np.zeros((len(menu), len(inventory)))
+    for menu_item_id, inventory_id, quantity in session.execute(
+            select(RecipeItem.menu_item_id, RecipeItem.inventory_id, RecipeItem.quantity)):
+        if menu_item_id in menu_index and inventory_id in inventory_index:
+            recipe[menu_index[menu_item_id], inventory_index[inventory_id]] = quantity
+
+    sold = dict(session.execute(
+        select(MenuItemSales.menu_item_id, func.sum(MenuItemSales.quantity))
+        .where(MenuItemSales.date >= since)
+        .group_by(MenuItemSales.menu_item_id)
+    ).all())
+    popularity = np.array([sold.get(row.id, 0) for row in menu], dtype=np.float64)
+    popularity = popularity / popularity.sum() if popularity.sum() else np.full(len(menu), 1 / max(len(menu), 1))
+
+    days, orders, items = session.execute(
+        select(func.count(DailySales.id), func.sum(DailySales.order_count), func.sum(DailySales.items_sold))
+        .where(DailySales.date >= since, DailySales.date < today)
+    ).one()
+    open_hours = CLOSE_HOUR - OPEN_HOUR
+    orders_per_hour = orders / (days * open_hours) if orders else BACKFILL_ORDERS_PER_HOUR
+    units_per_order = items / orders if orders else UNITS_PER_ORDER
+
+    staff = {
+        role: (count, wage)
+        for role, count, wage in session.execute(
+            select(Employee.role, func.count(Employee.id), func.avg(Employee.hourly_wage)).group_by(Employee.role))
+    }
+    coverage = {role: shift_coverage(role, OPEN_HOUR, CLOSE_HOUR) for role in staff}
+
+    # Demand through the day follows the observed hourly orders (the
+    # arrivals curve without history). Every order in history was served, so
+    # the on-shift staff managed at least the busiest hour's orders;
+    # calibrating to that peak lets the unchanged staffing serve the
+    # observed volume.
+    hourly = session.execute(
+        select(HourlySales.hour, func.sum(HourlySales.order_count), func.max(HourlySales.order_count))
+        .where(HourlySales.date >= since, HourlySales.date < today)
+        .group_by(HourlySales.hour)
+    ).all()
+    hourly_curve = np.array([DEMAND_CURVE.get(h, 0.0) for h in range(24)])
+    if orders:
+        hourly_curve = np.zeros(24)
+        for hour, count, _ in hourly:
+            hourly_curve[hour] = count / (days * orders_per_hour)
+    serving = sum((staff[role][0] * coverage[role] for role in SERVING_ROLES if role in staff), np.zeros(24))
+    rates = [peak / serving[hour] for hour, _, peak in hourly if peak and serving[hour] > 0]
+    orders_per_staff_hour = max(rates) if rates else ORDERS_PER_STAFF_HOUR
+    return ScenarioInputs(
+        item_names=[row.name for row in menu],
+        prices=np.array([row.price for row in menu], dtype=np.float64),
+        popularity=popularity,
+        recipe=recipe,
+        inventory_names=[inv.item_name for inv in inventory],
+        on_hand=np.array([inv.quantity_on_hand for inv in inventory], dtype=np.float64),
+        reorder_level=np.array([inv.reorder_level for inv in inventory], dtype=np.float64),
+        restock_level=np.array([inv.restock_level for inv in inventory], dtype=np.float64),
+        unit_cost=np.array([inv.unit_cost for inv in inventory], dtype=np.float64),
+        lead_time_days=np.array([math.ceil(inv.lead_time_days or 0) for inv in inventory], dtype=np.int64),
+        staff=staff,
+        shift_coverage=coverage,
+        orders_per_staff_hour=orders_per_staff_hour,
+        orders_per_hour=orders_per_hour,
+        units_per_order=units_per_order,
+        hourly_curve=hourly_curve,
+        opening_cash=current_balance(session),
+    )
+
+def _by_name(names, overrides, what):
+    unknown = set(overrides) - set(names)
+    if unknown:
+        raise ValueError(f"Unknown {what}: {', '.join(sorted(unknown))}")
+    return {names.index(name): value for name, value in overrides.items()}
+
+def simulate_runs(inputs, scenario, runs, days, seed=None):
+    """Simulate `runs` independent paths of `days` business days; returns per-run metric arrays"""
+    rng = np.random.default_rng(seed)
+    prices = inputs.prices.copy()
+    for i, price in _by_name(inputs.item_names, scenario.prices, 'menu items').items():
+        prices[i] = price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_ratio = np.where(inputs.prices > 0, prices / inputs.prices, 1.0)
+    unit_share = inputs.popularity * price_ratio ** PRICE_ELASTICITY
+    reorder_level = inputs.reorder_level.copy()
+    restock_level = inputs.restock_level.copy()
+    for j, level in _by_name(inputs.inventory_names, scenario.reorder_levels, 'inventory items').items():
+        reorder_level[j] = level
+    for j, level in _by_name(inputs.inventory_names, scenario.restock_levels, 'inventory items').items():
+        restock_level[j] = level
+
+    headcount = {role: max(0, count + scenario.staff.get(role, 0)) for role, (count, _) in inputs.staff.items()}
+    open_hours = np.nonzero(inputs.hourly_curve)[0]
+    # Expected staff on shift per role and hour, and the day's payroll for those hours
+    on_shift = {role: headcount[role] * inputs.shift_coverage[role] for role in headcount}
+    payroll = sum(wage * on_shift[role].sum() for role, (_, wage) in inputs.staff.items())
+    capacity = sum(on_shift[role][open_hours] for role in SERVING_ROLES if role in on_shift) * inputs.orders_per_staff_hour
+    hourly_rates = inputs.orders_per_hour * scenario.demand_multiplier * inputs.hourly_curve[open_hours]
+    uses = inputs.recipe > 0
+    instant = inputs.lead_time_days == 0
+
+    n_inventory = len(inputs.inventory_names)
+    # Deliveries in flight, as a ring buffer indexed by arrival day
+    horizon = int(inputs.lead_time_days.max(initial=0)) + 1
+    pending = np.zeros((runs, horizon, n_inventory))
+    stock = np.tile(inputs.on_hand, (runs, 1))
+    cash = np.full(runs, inputs.opening_cash)
+    min_cash = cash.copy()
+    revenue = np.zeros(runs)
+    purchases = np.zeros(runs)
+    lost_orders = np.zeros(runs)
+    stockout_days = np.zeros(runs)
+
+    for day in range(days):
+        slot = day % horizon
+        stock += pending[:, slot]
+        pending[:, slot] = 0
+
+        demand = rng.poisson(hourly_rates, size=(runs, len(hourly_rates)))
+        served = np.minimum(demand, capacity).sum(axis=1)
+        lost_orders += demand.sum(axis=1) - served
+        units = rng.poisson(served[:, None] * inputs.units_per_order * unit_share[None, :])
+
+        # Sell what the stock allows: each item is limited by its scarcest
+        # ingredient. Zero-lead-time stock is reordered as soon as an order
+        # takes it below its reorder level, so it never runs out; it simply
+        # costs what was used.
+        need = units @ inputs.recipe
+        with np.errstate(divide='ignore', invalid='ignore'):
+            available = np.where((need > 0) & ~instant, np.minimum(1.0, stock / need), 1.0)
+        fill = np.where(uses[None, :, :], available[:, None, :], 1.0).min(axis=2)
+        sold = np.floor(units * fill)
+        stockout_days += (fill < 1).any(axis=1)
+        used = sold @ inputs.recipe
+        stock = np.where(instant, stock, np.maximum(stock - used, 0.0))
+        day_revenue = sold @ prices
+
+        # Reorder the rest at close, like place_reorders(): top up low items not already on order
+        on_order = pending.sum(axis=1) > 0
+        quantity = np.where((stock <= reorder_level) & ~on_order & ~instant, np.maximum(restock_level - stock, 0.0), 0.0)
+        for lead in np.unique(inputs.lead_time_days[~instant]):
+            pending[:, (day + lead) % horizon] += quantity * (inputs.lead_time_days == lead)
+        day_purchases = (quantity + used * instant) @ inputs.unit_cost
+
+        revenue += day_revenue
+        purchases += day_purchases
+        cash += day_revenue - day_purchases - payroll
+        np.minimum(min_cash, cash, out=min_cash)
+
+    return {
+        'profit': revenue - purchases - payroll * days,
+        'revenue': revenue,
+        'purchases': purchases,
+        'ending_cash': cash,
+        'min_cash': min_cash,
+        'stockout_days': stockout_days,
+        'lost_orders': lost_orders,
+    }
+
+def run_scenario(inputs, scenario, runs=10000, days=30, seed=0, workers=None):
+    """Spread the runs over a process pool and return the combined per-run metrics.
+
+    Scenarios run with the same seed see the same random demand, so their
+    differences come from the scenario rather than from noise.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = [len(c) for c in np.array_split(np.arange(runs), min(workers, runs)) if len(c)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if len(chunks) == 1:
+        parts = [simulate_runs(inputs, scenario, chunks[0], days, seeds[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            parts = list(pool.map(simulate_runs, [inputs] * len(chunks), [scenario] * len(chunks),
+                                  chunks, [days] * len(chunks), seeds))
+    return {metric: np.concatenate([part[metric] for part in parts]) for metric in parts[0]}
+
+def summarize(results):
+    """Mean and percentiles of each metric, plus the chance of any stockout or negative cash"""
+    summary = {
+        metric: {'mean': float(values.mean()), **{f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}}
+        for metric, values in results.items()
+    }
+    summary['stockout_probability'] = float((results['stockout_days'] > 0).mean())
+    summary['overdraft_probability'] = float((results['min_cash'] < 0).mean())
+    return summary
+
+def _parse_overrides(pairs, value_type=float):
+    overrides = {}
+    for pair in pairs or []:
+        name, value = pair.rsplit('=', 1)
+        overrides[name] = value_type(value)
+    return overrides
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo what-if analysis of pricing, staffing and reorder rules.')
+    parser.add_argument('--price', action='append', metavar='ITEM=PRICE', help='new menu price (repeatable)')
+    parser.add_argument('--staff', action='append', metavar='ROLE=CHANGE', help='headcount change, e.g. Cashier=-1')
+    parser.add_argument('--reorder-level', action='append', metavar='ITEM=LEVEL', help='inventory reorder level')
+    parser.add_argument('--restock-level', action='append', metavar='ITEM=LEVEL', help='inventory restock level')
+    parser.add_argument('--demand', type=float, default=1.0, help='demand multiplier')
+    parser.add_argument('--days', type=int, default=30, help='business days per run')
+    parser.add_argument('--runs', type=int, default=10000, help='Monte Carlo runs per scenario')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (shared by baseline and scenario)')
+    args = parser.parse_args()
+
+    with get_sessionmaker(read_only=True)() as session:
+        inputs = load_inputs(session)
+    scenario = Scenario(
+        name='scenario',
+        prices=_parse_overrides(args.price),
+        staff=_parse_overrides(args.staff, int),
+        reorder_levels=_parse_overrides(args.reorder_level),
+        restock_levels=_parse_overrides(args.restock_level),
+        demand_multiplier=args.demand,
+    )
+    print(f'{inputs.orders_per_hour:.0f} orders/hour, {inputs.units_per_order:.1f} units/order, '
+          f'{inputs.orders_per_staff_hour:.0f} orders per serving staff-hour, '
+          f'opening cash ${inputs.opening_cash:,.2f}; {args.runs} runs x {args.days} days')
+    started = time.perf_counter()
+    summaries = {s.name: summarize(run_scenario(inputs, s, args.runs, args.days, args.seed, args.workers))
+                 for s in (Scenario(), scenario)}
+    print(f'Simulated {2 * args.runs * args.days:,} days in {time.perf_counter() - started:.1f}s')
+    print(f"{'metric':<16}" + ''.join(f'{name + " p" + str(p):>18}' for name in summaries for p in PERCENTILES))
+    for metric in ('profit', 'revenue', 'ending_cash', 'min_cash', 'stockout_days', 'lost_orders'):
+        print(f'{metric:<16}' + ''.join(f"{summaries[name][metric][f'p{p}']:>18,.0f}"
+                                        for name in summaries for p in PERCENTILES))
+    for name, summary in summaries.items():
+        print(f"{name}: stockout probability {summary['stockout_probability']:.1%}, "
+              f"overdraft probability {summary['overdraft_probability']:.1%}")
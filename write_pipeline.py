@@ -0,0 +1,105 @@
+import asyncio
+import collections
+import random
+import time
+from sqlalchemy.orm import sessionmaker
+from db import create_writer_engine
+from reference_data import get_reference_data
+from sql_profiling import QueryStats, profile
+from simulate_transactions import Session, draw_order, write_orders
+
+# Flush when this many orders are buffered or the oldest has waited FLUSH_MS
+BATCH_SIZE = 500
+FLUSH_MS = 50
+# PRAGMA synchronous for the pipeline's connections. In WAL mode FULL syncs
+# every commit, NORMAL only at checkpoints (a power cut can lose the last
+# commits, never corrupt) and OFF leaves syncing to the OS.
+DURABILITY_LEVELS = ('FULL', 'NORMAL', 'OFF')
+RATE_WINDOW_SECONDS = 10
+
+class WritePipeline:
+    """Group-commit writer: buffers order arrivals and writes each batch in one transaction.
+
+    `run(queue)` consumes order times from an asyncio queue and flushes every
+    `batch_size` orders or `flush_ms` milliseconds, whichever comes first,
+    on a worker thread. Pass `durability` to write through a dedicated
+    engine with that synchronous level instead of `session_factory`.
+    """
+
+    def __init__(self, session_factory=None, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS, durability=None,
+                 seed=None, verbose=False):
+        if durability is not None:
+            if durability.upper() not in DURABILITY_LEVELS:
+                raise ValueError(f'durability must be one of {DURABILITY_LEVELS}')
+            session_factory = sessionmaker(bind=create_writer_engine(synchronous=durability.upper()))
+        self.session_factory = session_factory or Session
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.orders_written = 0
+        self.batches_written = 0
+        self.errors = 0
+        self.last_error = None
+        # SQL stats across writes; callers read and reset() it per reporting interval
+        self.sql_stats = QueryStats()
+        self._written = collections.deque()
+
+    def write(self, order_times):
+        """Draw and write one order per time in a single transaction; returns the order ids"""
+        session = self.session_factory()
+        with profile(self.sql_stats):
+            try:
+                refs = get_reference_data(session)
+                order_ids = write_orders(session, refs, [draw_order(refs, t, self.rng) for t in order_times], self.verbose)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+        self.orders_written += len(order_ids)
+        self.batches_written += 1
+        self._written.append((time.monotonic(), len(order_ids)))
+        if self.verbose and len(order_ids) == 1:
+            print(f"Added order {order_ids[0]} at {order_times[0].strftime('%Y-%m-%d %H:%M:%S')}")
+        elif self.verbose and order_ids:
+            print(f'Added orders {order_ids[0]}-{order_ids[-1]} in one commit')
+        return order_ids
+
+    @property
+    def orders_per_second(self):
+        """Orders written per second over the last RATE_WINDOW_SECONDS"""
+        cutoff = time.monotonic() - RATE_WINDOW_SECONDS
+        while self._written and self._written[0][0] < cutoff:
+            self._written.popleft()
+        return sum(n for _, n in self._written) / RATE_WINDOW_SECONDS
+
+    async def _next_batch(self, queue):
+        batch = [await queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_ms / 1000
+        while len(batch) < self.batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self, queue):
+        """Consume order times from `queue` until cancelled"""
+        while True:
+            batch = await self._next_batch(queue)
+            try:
+                await asyncio.to_thread(self.write, batch)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            finally:
+                for _ in batch:
+                    queue.task_done()